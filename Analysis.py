@@ -1,6 +1,7 @@
 import sys
 import os
 import ast
+import multiprocessing
 os.environ['MPLCONFIGDIR'] = os.path.expanduser('~/.myapp_matplotlib_cache')
 
 def resource_path(relative_path):
@@ -12,20 +13,7 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-def user_data_path(filename):
-    """Return a user-writable path for persistent app data."""
-    if sys.platform == "darwin":
-        # macOS
-        app_support = os.path.expanduser('~/Library/Application Support/Mitico')
-    elif os.name == "nt":
-        # Windows
-        app_support = os.path.join(os.environ.get('APPDATA', os.path.expanduser('~')), 'Mitico')
-    else:
-        # Linux/other
-        app_support = os.path.expanduser('~/.mitico')
-    if not os.path.exists(app_support):
-        os.makedirs(app_support, exist_ok=True)
-    return os.path.join(app_support, filename)
+from AppPaths import user_data_path
 
 # On startup, ensure user copy of run_parameters.csv exists
 BUNDLED_CSV = resource_path("run_parameters.csv")
@@ -40,7 +28,8 @@ if not os.path.isfile(USER_CSV):
 
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QPushButton, QLabel,
-    QVBoxLayout, QHBoxLayout, QFileDialog, QTabWidget, QGroupBox, QLineEdit, QComboBox
+    QVBoxLayout, QHBoxLayout, QFileDialog, QTabWidget, QGroupBox, QLineEdit, QComboBox,
+    QCheckBox
 )
 
 from PyQt5.QtCore import QTimer
@@ -49,29 +38,44 @@ import csv
 from DataViewer import DataViewer
 from CapacityAnalysis import CapacityAnalysis
 from TableViewer import TableViewer
-from FileParsers import MassSpecParser, BackendParser, Baldy2Parser, save_pdf_report
+from FileParsers import MassSpecParser, BackendParser, Baldy2Parser, LiveFollower, \
+    compact_frame, compact_savings, save_pdf_report
+from RunCache import RunCache
+from CycleIndex import CycleIndex
+from ColumnStatistics import ColumnStatistics
+from CapacityEngine import DEFAULT_STATE_TEXT, GAS_ABBREVIATIONS
 from datetime import datetime
 from RawDataViewer import RawDataViewer
+from SweepViewer import SweepViewer
+from CycleOverview import CycleOverview
+
+# How often live mode checks the QMS and backend files for new rows
+LIVE_POLL_INTERVAL_MS = 10000
 
 class MyApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.mdf = pd.DataFrame()
         self.cycle_times_df = pd.DataFrame()
+        self.cycle_index = CycleIndex(self.mdf)
+        self.column_stats = None
+        # All-NaN backend columns removed from the run in compact memory mode
+        self.dropped_columns = []
 
         self.status_text = ""
         self.status_error = ""
 
+        # Parsed and merged runs are cached next to run_parameters.csv
+        self.run_cache = RunCache(user_data_path("run_cache"))
 
-        self.gas_abbr = {
-            "":"",
-            "Nitrogen": "N2",
-            "Oxygen": "O2",
-            "Argon": "Ar",
-            "Helium": "He",
-            "Hydrogen": "H2",
-            "Carbon dioxide": "CO2",
-        }
+        # Live mode polls the files of a run that is still in progress
+        self.backend_folder = None
+        self.live_follower = None
+        self.live_timer = QTimer(self)
+        self.live_timer.timeout.connect(self.poll_live)
+
+
+        self.gas_abbr = GAS_ABBREVIATIONS
         self.load_default_state()
 
         # Create new instances
@@ -79,6 +83,8 @@ class MyApp(QMainWindow):
         self.cycle_instance = CapacityAnalysis(self)
         self.metrics_instance = TableViewer(self)
         self.raw_data_instance = RawDataViewer(self)
+        self.sweep_instance = SweepViewer(self)
+        self.overview_instance = CycleOverview(self)
 
         self.build_layout()
 
@@ -234,6 +240,7 @@ class MyApp(QMainWindow):
     def load_qms_data(self):
         """Load a QMS CSV file and propagate UI changes based on data"""
         self.tabs.setHidden(True)
+        self.live_button.setChecked(False)
         #Clear text boxess
         self.run_parameters_groupbox.setEnabled(False)
 
@@ -249,6 +256,7 @@ class MyApp(QMainWindow):
         if file_name: #Effectively we want to start from scratch
             self.filepath = file_name
             self.filename = f"{os.path.basename(file_name)}"
+            self.backend_folder = None
             for widget in self.state_text.keys():
                 self.widget_lookup[widget].setText('')
             self.reference_gas_dropdown.clear()
@@ -256,7 +264,11 @@ class MyApp(QMainWindow):
             self.cycle_instance.current_cycle_index = 0
             try:
                 self.parser = MassSpecParser(self)
-                self.mdf, self.compound_list, self.cycle_times_df = self.parser.parse()
+                self.mdf, self.compound_list, self.cycle_times_df = \
+                    self.run_cache.fetch([self.filepath], self.parser.parse)
+                self.cycle_index = CycleIndex(self.mdf)
+                self.dropped_columns = []
+                self.compact_mdf(self.compound_list)
                 self.reference_gas_dropdown.addItems(self.compound_list)
                 self.file_label.setStyleSheet("")
                 self.file_label.setText(f"File: {os.path.basename(file_name)}")
@@ -265,12 +277,15 @@ class MyApp(QMainWindow):
                 self.time_label.setText(f"Datetime: {self.mdf.index[0]}")
                 self.duration_label.setText(
                     f"Duration: {self.mdf.index[-1]-self.mdf.index[0]}")
+                self.update_memory_label()
                 self.secondary_status.setEnabled(True)
                 self.secondary_status.setStyleSheet("")
-                self.secondary_status.setText("Status: No Secondary Loaded")
+                self.secondary_status.setText(
+                    self.with_cache_warning("Status: No Secondary Loaded"))
                 self.run_parameters_groupbox.setEnabled(True)
                 self.baldy2_button.setEnabled(True)
                 self.baldy3_button.setEnabled(True)
+                self.live_button.setEnabled(True)
                 self.select_button.setText("Load New QMS Data (Restart)")
                 self.load_run_parameters()
                 self.save_pdf_button.setEnabled(True)  # Enable PDF button when data is loaded
@@ -286,26 +301,45 @@ class MyApp(QMainWindow):
                 self.parameter_status.setText("Status: Waiting for QMS data load")
                 self.baldy2_button.setEnabled(False)
                 self.baldy3_button.setEnabled(False)
+                self.live_button.setEnabled(False)
                 self.run_parameters_groupbox.setEnabled(False)
         else: #Nothing has happened, cancel button was selected
             self.tabs.setHidden(False)
             self.run_parameters_groupbox.setEnabled(True)
 
+    def with_cache_warning(self, text):
+        """Status text, followed by any problem the run cache had with the last load"""
+        if self.run_cache.warning:
+            return f'{text} – {self.run_cache.warning}'
+        return text
+
     def load_reactor_data(self):
         """Load a data folder from the Baldy3 backend and propagate UI changes"""
         self.secondary_status.setStyleSheet("")
         self.secondary_status.setText('Status: Loading')
         self.tabs.setHidden(True)
+        self.live_button.setChecked(False)
         folder_path = QFileDialog.getExistingDirectory(None,"Select Folder","")
         if folder_path:
             try:
                 QApplication.processEvents()
                 #  TODO PASS THE INSTANCE INSTEAD TO BACKEND PARSER
                 backend_parser = BackendParser(
-                    self.mdf, self.time_label.text(), self.duration_label.text(), self.file_label.text()[6:], folder_path)
-                self.mdf, self.reactor_parameters, self.cycle_times_df = backend_parser.parse()
+                    self.mdf, self.time_label.text(), self.duration_label.text(), self.file_label.text()[6:], folder_path,
+                    catalog_dir=user_data_path("backend_catalog"))
+                self.mdf, self.reactor_parameters, self.cycle_times_df = \
+                    self.run_cache.fetch(
+                        [self.filepath] + backend_parser.backend_files(),
+                        backend_parser.parse,
+                        'compact' if self.compact_checkbox.isChecked() else '')
+                self.compact_mdf(self.compound_list + self.reactor_parameters,
+                                 drop_empty=self.reactor_parameters)
+                self.cycle_index = CycleIndex(self.mdf)
+                self.update_memory_label()
                 self.secondary_status.setStyleSheet("")
-                self.secondary_status.setText('Status: Reactor data merge OK')
+                self.backend_folder = folder_path
+                self.secondary_status.setText(
+                    self.with_cache_warning('Status: Reactor data merge OK'))
                 self.baldy3_button.setEnabled(False)
                 self.baldy2_button.setEnabled(False)
                 self.load_run_parameters()
@@ -332,8 +366,14 @@ class MyApp(QMainWindow):
         )
         if file_name:
             try:
-                baldy2_parser = Baldy2Parser(self.mdf, file_name)
+                baldy2_parser = Baldy2Parser(
+                    self.mdf, file_name,
+                    join='interpolate' if self.baldy2_interpolate_checkbox.isChecked()
+                    else 'nearest')
                 self.mdf, self.reactor_parameters = baldy2_parser.parse()
+                self.compact_mdf(self.compound_list + self.reactor_parameters)
+                self.cycle_index = CycleIndex(self.mdf)
+                self.update_memory_label()
                 self.secondary_status.setStyleSheet("")
                 self.secondary_status.setText('Status: Temp data merge OK')
                 self.baldy2_button.setEnabled(False)
@@ -347,40 +387,129 @@ class MyApp(QMainWindow):
         else: self.secondary_status.setText("Status: No Secondary File Loaded")
 
      
+    def toggle_live_mode(self, checked):
+        """Start or stop following the QMS file and backend folder as they grow"""
+        if checked:
+            try:
+                self.live_follower = LiveFollower(
+                    self.parser, self.mdf.index[-1], self.backend_folder)
+            except (OSError, ValueError) as e:
+                self.secondary_status.setStyleSheet("color: red")
+                self.secondary_status.setText(f'Status: Live mode failed – {e}')
+                self.live_button.setChecked(False)
+                return
+            self.live_button.setText("Live Mode: Following (click to stop)")
+            self.live_timer.start(LIVE_POLL_INTERVAL_MS)
+        else:
+            self.live_timer.stop()
+            self.live_follower = None
+            self.live_button.setText("Live Mode: Follow Files")
+
+    def poll_live(self):
+        """Append newly written rows and recalculate only the cycles they touch"""
+        #New rows wait in the files until a running calculation lands
+        if self.cycle_instance.calculating():
+            return
+        try:
+            rows = self.live_follower.poll()
+            if rows is None or rows.empty:
+                return
+            cycle_times_df, cycles = \
+                self.live_follower.extend_cycle_times(self.cycle_times_df, rows)
+        except (OSError, ValueError) as e:
+            #Rotated/deleted files or malformed lines stop following
+            self.live_button.setChecked(False)
+            self.secondary_status.setStyleSheet("color: red")
+            self.secondary_status.setText(f'Status: Live mode stopped – {e}')
+            return
+        first_row = len(self.mdf)
+        column_stats = self.column_statistics()
+        if self.compact_checkbox.isChecked():
+            rows = rows.drop(columns=self.dropped_columns, errors='ignore')
+            compact_frame(rows, self.compound_list + self.reactor_parameters)
+        self.mdf = pd.concat([self.mdf, rows])
+        self.cycle_index = CycleIndex(self.mdf)
+        self.cycle_times_df = cycle_times_df
+        self.duration_label.setText(
+            f"Duration: {self.mdf.index[-1]-self.mdf.index[0]}")
+        #Derived columns only exist once run parameters have been valid
+        if 'CO2 Absorbed [mol]' in self.mdf.columns:
+            try:
+                self.cycle_instance.update_live(first_row, cycles)
+                column_stats.append(self.mdf, first_row,
+                                    self.cycle_instance.calculator.recalculated)
+            except ValueError as e:
+                print('live update skipped', e)
+            self.metrics_instance.update_table()
+            self.metrics_instance.update_plot()
+        else:
+            column_stats.append(self.mdf, first_row, {})
+        self.viewer_instance.update_plot()
+        self.overview_instance.refresh()
+        self.update_memory_label()
+
+    def column_statistics(self):
+        """ColumnStatistics of mdf, started over whenever mdf is replaced"""
+        if self.column_stats is None or self.column_stats.frame is not self.mdf:
+            self.column_stats = ColumnStatistics(self.mdf)
+        return self.column_stats
+
+    def compact_mdf(self, columns, drop_empty=()):
+        """In compact memory mode, downcast columns of mdf and drop empty ones"""
+        if not self.compact_checkbox.isChecked():
+            return
+        dropped = compact_frame(self.mdf, columns, drop_empty)
+        self.dropped_columns += dropped
+        self.reactor_parameters = [col for col in self.reactor_parameters
+                                   if col not in dropped]
+
+    def update_memory_label(self):
+        memory = self.mdf.memory_usage(index=False).sum()
+        saved = compact_savings(self.mdf, self.dropped_columns)
+        text = f"Memory: {memory / 1e6:.1f} MB"
+        if self.compact_checkbox.isChecked() and saved > 0:
+            text += f" (compact mode saved {saved / 1e6:.1f} MB)"
+        self.memory_label.setText(text)
+
     def update_all_calculations(self):
         print('updating all')
         self.tabs.setHidden(True)
-        self.old_text = self.secondary_status.text()
+        #A superseded or failed calculation already replaced the status text
+        if not self.cycle_instance.calculating() and not \
+                self.secondary_status.text().startswith('Status: Calculation failed'):
+            self.old_text = self.secondary_status.text()
+            self.old_style = self.secondary_status.styleSheet()
         self.secondary_status.setText('Calculating... please wait')
-        QApplication.processEvents()
-        QTimer.singleShot(100, self._do_calculations)  # 100 ms delay
-
-    def _do_calculations(self):
         self.cycle_instance.pull_state()
-        self.cycle_instance.propagate_change()
+        self.cycle_instance.start_calculation(self._show_calculations,
+                                              self._show_calculation_progress,
+                                              self._show_calculation_failure)
+
+    def _show_calculation_progress(self, done, total):
+        self.secondary_status.setText(f'Calculating... please wait ({done}/{total})')
+
+    def _show_calculation_failure(self):
+        #The error status replaces the calculating text
+        self.tabs.setHidden(False)
+
+    def _show_calculations(self):
+        self.cycle_instance.update_plots()
         self.viewer_instance.pull_state()
         self.viewer_instance.update_plot()
         self.metrics_instance.pull_state()
         self.metrics_instance.update_table()
         self.metrics_instance.update_plot()
         self.raw_data_instance.update_table()
+        self.sweep_instance.pull_state()
+        self.update_memory_label()
         self.tabs.setHidden(False)
+        self.secondary_status.setStyleSheet(self.old_style)
         self.secondary_status.setText(self.old_text)
 
     def load_default_state(self):
         #Load state with default app values
         self.reactor_parameters = []
-        self.state_text = {
-            "Sorbent Mass [g]": "",
-            "Reactor Diameter [in]": "0.8",
-            "Sorbent Bulk Density [g/mL]": "",
-            "Input Flow Rate [SCCM]": "150",
-            "Packing Factor": "0.55",
-            "Reactor Input Ratio (%)": "10",
-            "QMS Input Ratio (%)": "",
-            "Regression Start (%)": "0.5",
-            "Regression End (%)": "9",
-        }
+        self.state_text = dict(DEFAULT_STATE_TEXT)
         self.state_qlist = {    
             "Selected Compounds": ['Carbon dioxide'],
             "Selected Parameters": [],
@@ -430,6 +559,11 @@ class MyApp(QMainWindow):
         self.file_label = QLabel("File: ")
         self.time_label = QLabel("Start Date: ")
         self.duration_label = QLabel("Run Duration: ")
+        self.memory_label = QLabel("Memory: ")
+        self.compact_checkbox = QCheckBox("Compact Memory Mode")
+        self.compact_checkbox.setToolTip(
+            "Store signals as float32 and cycle counters as small integers, and "
+            "drop empty backend columns. Applies to data loaded afterwards.")
 
         qms_groupbox_layout = QVBoxLayout()
         qms_groupbox_layout.setSpacing(8)
@@ -438,17 +572,27 @@ class MyApp(QMainWindow):
         qms_groupbox_layout.addWidget(self.file_label)
         qms_groupbox_layout.addWidget(self.time_label)
         qms_groupbox_layout.addWidget(self.duration_label)
+        qms_groupbox_layout.addWidget(self.memory_label)
+        qms_groupbox_layout.addWidget(self.compact_checkbox)
 
         # LOAD OTHER DATA SECTION
         self.baldy3_button = QPushButton("Baldy3: Load Data Folder")
         self.baldy3_button.setEnabled(False)
         self.baldy2_button = QPushButton("Baldy2: Load Temperature Data")
         self.baldy2_button.setEnabled(False)
+        # Off: nearest reading within 10 s, on: interpolated between readings
+        self.baldy2_interpolate_checkbox = QCheckBox("Baldy2: Interpolate Temperatures")
         self.secondary_status = QLabel("Status: Waiting for QMS data load")
         self.secondary_status.setEnabled(False)
 
+        self.live_button = QPushButton("Live Mode: Follow Files")
+        self.live_button.setCheckable(True)
+        self.live_button.setEnabled(False)
+
         qms_groupbox_layout.addWidget(self.baldy3_button)
         qms_groupbox_layout.addWidget(self.baldy2_button)
+        qms_groupbox_layout.addWidget(self.baldy2_interpolate_checkbox)
+        qms_groupbox_layout.addWidget(self.live_button)
         qms_groupbox_layout.addWidget(self.secondary_status)
 
         qms_groupbox = QGroupBox("File Management")
@@ -578,8 +722,10 @@ class MyApp(QMainWindow):
         self.tabs.setTabPosition(QTabWidget.North)
         self.tabs.addTab(self.viewer_instance, "Run Graph")
         self.tabs.addTab(self.cycle_instance,"Cycle Graph")
+        self.tabs.addTab(self.overview_instance, "Cycle Overview")
         self.tabs.addTab(self.metrics_instance, "Cycle Metrics")
         self.tabs.addTab(self.raw_data_instance, "Raw Data")
+        self.tabs.addTab(self.sweep_instance, "Parameter Sweep")
         self.tabs.setHidden(True)
         self.viewer_layout.addWidget(self.tabs)
 
@@ -610,6 +756,7 @@ class MyApp(QMainWindow):
         self.select_button.clicked.connect(self.load_qms_data)
         self.baldy3_button.clicked.connect(self.load_reactor_data)
         self.baldy2_button.clicked.connect(self.load_temp_data)
+        self.live_button.toggled.connect(self.toggle_live_mode)
         self.save_parameters_button.clicked.connect(self.save_run_parameters)
         self.save_pdf_button.clicked.connect(lambda: save_pdf_report(self))
 
@@ -623,6 +770,8 @@ class MyApp(QMainWindow):
                     self.check_run_parameters()
 
 if __name__ == "__main__":
+    # Parameter sweeps run on a process pool, also from a bundled app
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MyApp()
     window.show()
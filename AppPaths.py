@@ -0,0 +1,17 @@
+import os
+import sys
+
+def user_data_path(filename):
+    """Return a user-writable path for persistent app data."""
+    if sys.platform == "darwin":
+        # macOS
+        app_support = os.path.expanduser('~/Library/Application Support/Mitico')
+    elif os.name == "nt":
+        # Windows
+        app_support = os.path.join(os.environ.get('APPDATA', os.path.expanduser('~')), 'Mitico')
+    else:
+        # Linux/other
+        app_support = os.path.expanduser('~/.mitico')
+    if not os.path.exists(app_support):
+        os.makedirs(app_support, exist_ok=True)
+    return os.path.join(app_support, filename)
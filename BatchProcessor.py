@@ -0,0 +1,150 @@
+"""Headless batch processing of QMS runs, without the GUI
+
+    python BatchProcessor.py RUN_DIR [--backend FOLDER] [--parameters CSV]
+        [--output DIR] [--format csv|parquet] [--workers N]
+
+Every QMS export in RUN_DIR is merged with the backend folder (when given) and
+analyzed with its latest saved row of run_parameters.csv, as the Cycle
+Analysis tab would. The CSV defaults to the one the app saves to. Each run's cycle metrics are written to
+<output>/<run>_metrics.<format>, and a summary row per run to
+<output>/summary.<format>.
+"""
+import os
+import csv
+import ast
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+import pandas as pd
+from FileParsers import MassSpecParser, BackendParser
+from CycleIndex import CycleIndex
+from AppPaths import user_data_path
+from CapacityEngine import DEFAULT_STATE_TEXT, RunParameters, analyze_run
+
+# Saved cut override lists, in the order CapacityEngine expects them
+CUT_KEYS = ['Start Cuts', 'End Cuts', 'Regression Start Cuts', 'Regression End Cuts']
+# Per-cycle metrics averaged into the summary table
+SUMMARY_METRICS = ['Experimental CO2absorbed [mol]', 'Sorbent Capacity [gCO2/gSorbent]',
+                   'Capacity % to KPI', 'Rate Constant K (Dry)',
+                   'Rate Constant K (Wet)', 'Wet Kinetics Regression R2']
+
+def is_qms_export(path):
+    """Whether a CSV starts with the QMS export's scans line"""
+    with open(path, 'rb') as f:
+        fields = f.readline().decode('latin-1').split(',')
+    return len(fields) > 1 and fields[1] == 'scans'
+
+def read_run_parameters(csv_path):
+    """Latest saved run_parameters.csv row for each QMS filename"""
+    if not os.path.isfile(csv_path):
+        raise ValueError(f'No run parameters file at {csv_path}')
+    with open(csv_path, newline='') as f:
+        reader = csv.DictReader(f)
+        # Older files name their columns differently, the app starts them over
+        missing = [key for key in ['Filename', *DEFAULT_STATE_TEXT]
+                   if key not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f'{csv_path} is missing columns {missing}, '
+                             'save the runs from the app first')
+        return {row['Filename']: row for row in reader}
+
+def run_settings(row):
+    """Run parameters and cut override lists from a saved row"""
+    state_text = dict(DEFAULT_STATE_TEXT)
+    for key in state_text:
+        if row.get(key):
+            state_text[key] = row[key]
+    params = RunParameters.from_state(state_text, row.get('Reference Gas') or 'Argon')
+    cuts = [ast.literal_eval(row[key]) if row.get(key) else [] for key in CUT_KEYS]
+    return params, cuts
+
+def write_frame(df, path, output_format):
+    if output_format == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+def process_run(qms_path, backend_folder, parameters, output_dir, output_format,
+                parameters_csv=None):
+    """Parse, merge and analyze one run, write its metrics and return its summary"""
+    filename = os.path.basename(qms_path)
+    summary = {'Filename': filename, 'Status': 'OK', 'Cycles': 0}
+    try:
+        if parameters is None:
+            raise ValueError(f'No saved run parameters in {parameters_csv}')
+        params, cuts = run_settings(parameters)
+
+        parser = MassSpecParser(SimpleNamespace(filepath=qms_path, filename=filename))
+        mdf, _, cycle_times_df = parser.parse()
+        if backend_folder is not None:
+            backend_parser = BackendParser(mdf, parser.start_datetime, None,
+                                           filename, backend_folder)
+            mdf, _, cycle_times_df = backend_parser.parse()
+        cycle_index = CycleIndex(mdf)
+
+        # Saved cuts only apply while the number of cycles still matches
+        if len(cuts[0]) != len(cycle_times_df):
+            cuts = [[None] * len(cycle_times_df) for _ in CUT_KEYS]
+        analyze_run(mdf, cycle_times_df, cycle_index, params, cuts)
+
+        stem = os.path.splitext(filename)[0]
+        write_frame(cycle_times_df, os.path.join(
+            output_dir, f'{stem}_metrics.{output_format}'), output_format)
+        summary['Cycles'] = len(cycle_times_df)
+        for metric in SUMMARY_METRICS:
+            summary[f'Mean {metric}'] = cycle_times_df[metric].mean()
+    except Exception as e:
+        # One bad run shouldn't stop the batch, it's reported in the summary
+        summary['Status'] = f'Error: {e}'
+    print(f"{filename}: {summary['Status']}")
+    return summary
+
+def run_batch(run_dir, backend_folder=None, parameters_csv=None,
+              output_dir=None, output_format='csv', workers=None):
+    """Process every QMS export in run_dir across a process pool"""
+    parameters_csv = parameters_csv or user_data_path('run_parameters.csv')
+    output_dir = output_dir or os.path.join(run_dir, 'batch_output')
+    os.makedirs(output_dir, exist_ok=True)
+    parameters = read_run_parameters(parameters_csv)
+    qms_paths = sorted(
+        os.path.join(run_dir, name) for name in os.listdir(run_dir)
+        if name.lower().endswith('.csv') and is_qms_export(os.path.join(run_dir, name)))
+    if not qms_paths:
+        raise ValueError(f'No QMS exports found in {run_dir}')
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        summaries = list(executor.map(
+            process_run, qms_paths, [backend_folder] * len(qms_paths),
+            [parameters.get(os.path.basename(path)) for path in qms_paths],
+            [output_dir] * len(qms_paths), [output_format] * len(qms_paths),
+            [parameters_csv] * len(qms_paths)))
+
+    summary_df = pd.DataFrame(summaries)
+    write_frame(summary_df, os.path.join(output_dir, f'summary.{output_format}'),
+                output_format)
+    return summary_df
+
+def main():
+    argument_parser = argparse.ArgumentParser(
+        description='Analyze a folder of QMS runs without the GUI.')
+    argument_parser.add_argument('run_dir', help='folder of QMS export CSVs')
+    argument_parser.add_argument('--backend', default=None,
+        help='Baldy3 backend data folder (data_YYYY-MM-DD.csv files)')
+    argument_parser.add_argument('--parameters', default=None,
+        help="run_parameters.csv (default: the one the app saves, "
+             f"{user_data_path('run_parameters.csv')})")
+    argument_parser.add_argument('--output', default=None,
+        help='output folder (default: RUN_DIR/batch_output)')
+    argument_parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    argument_parser.add_argument('--workers', type=int, default=None,
+        help='worker processes (default: one per CPU)')
+    args = argument_parser.parse_args()
+    try:
+        summary_df = run_batch(args.run_dir, args.backend, args.parameters,
+                               args.output, args.format, args.workers)
+    except ValueError as e:
+        argument_parser.exit(1, f'Error: {e}\n')
+    print(summary_df.to_string(index=False))
+
+if __name__ == '__main__':
+    main()
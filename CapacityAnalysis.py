@@ -1,14 +1,165 @@
 from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, \
-    QApplication, QPushButton, QGroupBox, QLineEdit, QListWidget
-from PyQt5.QtCore import Qt
+    QApplication, QPushButton, QGroupBox, QLineEdit, QListWidget, QDialog, \
+    QTableWidget, QTableWidgetItem, QAbstractItemView
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas, \
     NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
 import pandas as pd
-from numpy import nan, sum, maximum, isfinite, pi, e, log, subtract, number, floor, \
-    log10
-from scipy.stats import linregress
+from numpy import isfinite, subtract, searchsorted, timedelta64
 import ast
+import threading
+import CapacityEngine
+from CycleIndex import row_positions
+
+# Override box and handler that commit each cut marker dragged on the plot
+CUT_OVERRIDES = {
+    'Sorption Start Time': ('sorption_start_override', 'cut_start'),
+    'Sorption End Time': ('sorption_end_override', 'cut_end'),
+    'Regression Start Time': ('regression_start_override', 'cut_regression_start'),
+    'Regression End Time': ('regression_end_override', 'cut_regression_end'),
+}
+# How close to a cut marker a press starts dragging it, in pixels
+CUT_PICK_PIXELS = 5
+
+class CalculationWorker(QThread):
+    """Runs a forked RunCalculator's update off the GUI thread
+
+    cancel() stops it before its next stage, without emitting calculated.
+    """
+    progress = pyqtSignal(object, int, int)
+    calculated = pyqtSignal(object)
+    failed = pyqtSignal(object, str)
+
+    def __init__(self, source, params, cuts, on_finished, on_progress=None,
+                 on_failed=None):
+        super().__init__()
+        self.source = source
+        self.calculator = source.fork()
+        self.params = params
+        self.cuts = cuts
+        self.on_finished = on_finished
+        self.on_progress = on_progress
+        self.on_failed = on_failed
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            self.calculator.update(self.params, self.cuts, self.cancelled.is_set,
+                lambda done, total: self.progress.emit(self, done, total))
+        except CapacityEngine.CalculationCancelled:
+            return
+        except Exception as e:
+            self.failed.emit(self, str(e))
+            return
+        self.calculated.emit(self)
+
+class CycleView:
+    """One cycle's rows of df as the Cycle Graph draws them
+
+    Keeps the cycle's elapsed minutes, each column plotted so far and where
+    the current cuts split its rows, so going back to a cycle reuses them.
+    Columns are forgotten when a calculation rewrites them, the splits when
+    the cycle's cut times move.
+    """
+    def __init__(self, cycle_index, position):
+        self.cycle_index = cycle_index
+        self.rows = cycle_index.cycle_rows(position)
+        times = cycle_index.times[self.rows]
+        self.minutes = (times - times[0]) / timedelta64(1, 'm')
+        self.columns = {}
+        self.cut_key = None
+        # Rows of df and positions within the cycle, by part of the cycle
+        self.windows = None
+        self.parts = None
+
+    def column(self, df, label):
+        """The cycle's values of a column of df"""
+        if label not in self.columns:
+            self.columns[label] = df[label].iloc[self.rows].to_numpy(copy=True)
+        return self.columns[label]
+
+    def local(self, window):
+        """A window of df rows as positions within this cycle"""
+        if isinstance(window, slice) and window.start == window.stop:
+            return slice(0, 0)
+        if isinstance(window, slice) and isinstance(self.rows, slice):
+            return slice(window.start - self.rows.start, window.stop - self.rows.start)
+        return searchsorted(row_positions(self.rows), row_positions(window))
+
+    def split(self, start_time, times):
+        """Rows left of, inside and right of the sorption cuts, and inside the regression cuts
+
+        times are the cycle's four CUT_TIME_COLUMNS, in minutes from start_time.
+        """
+        key = (start_time,) + tuple(times)
+        if key != self.cut_key:
+            start_cut, end_cut, regression_start, regression_end = [
+                start_time + pd.to_timedelta(minutes, unit='m') for minutes in times]
+            window = self.cycle_index.window
+            self.windows = {
+                'left': window(self.rows, end=start_cut, include_end=True),
+                'right': window(self.rows, start=end_cut, include_start=True),
+                'center': window(self.rows, start_cut, end_cut),
+                'sorption': window(self.rows, start_cut, end_cut, True, True),
+                'regression': window(self.rows, regression_start, regression_end),
+            }
+            self.parts = {name: self.local(rows) for name, rows in self.windows.items()}
+            self.cut_key = key
+        return self.parts
+
+class RegressionSuggestions(QDialog):
+    """Suggested regression cuts per cycle, to accept selected or all at once"""
+    def __init__(self, parent, suggestions, cycle_times_df):
+        super().__init__(parent)
+        self.setWindowTitle("Suggested Regression Windows")
+        self.suggestions = suggestions
+        self.accepted_positions = []
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Windows inside each cycle's sorption cuts with "
+                                "the highest Wet Kinetics Regression R2"))
+
+        columns = ['Cycle', 'Regression Start', 'Regression End', 'R2',
+                   'Suggested Start', 'Suggested End', 'Suggested R2']
+        self.table = QTableWidget(len(suggestions), len(columns))
+        self.table.setHorizontalHeaderLabels(columns)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        for i, (position, row) in enumerate(suggestions.iterrows()):
+            current = cycle_times_df.iloc[position]
+            values = [str(current['Cycle']),
+                      f"{current['Regression Start Time']:.2f} min",
+                      f"{current['Regression End Time']:.2f} min",
+                      f"{current['Wet Kinetics Regression R2']:.5f}",
+                      f"{row['Regression Start Cut']:.2f} min",
+                      f"{row['Regression End Cut']:.2f} min",
+                      f"{row['Wet Kinetics Regression R2']:.5f}"]
+            for j, value in enumerate(values):
+                self.table.setItem(i, j, QTableWidgetItem(value))
+        self.table.resizeColumnsToContents()
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        accept_selected = QPushButton("Accept Selected")
+        accept_all = QPushButton("Accept All")
+        cancel = QPushButton("Cancel")
+        buttons.addWidget(accept_selected)
+        buttons.addWidget(accept_all)
+        buttons.addStretch()
+        buttons.addWidget(cancel)
+        layout.addLayout(buttons)
+        accept_selected.clicked.connect(lambda: self.accept_rows(
+            sorted({index.row() for index in self.table.selectedIndexes()})))
+        accept_all.clicked.connect(lambda: self.accept_rows(range(len(suggestions))))
+        cancel.clicked.connect(self.reject)
+        self.resize(760, 500)
+
+    def accept_rows(self, rows):
+        self.accepted_positions = [self.suggestions.index[row] for row in rows]
+        self.accept()
 
 class CapacityAnalysis(QMainWindow):
     def __init__(self, analysis):
@@ -19,6 +170,14 @@ class CapacityAnalysis(QMainWindow):
         self.cycle_times_df = self.analysis.cycle_times_df
         self.xlim = [None] * len(self.cycle_times_df)
         self.ylim = [None] * len(self.cycle_times_df)
+        self.calculator = None
+        self.worker = None
+        #CycleViews by position, valid for views_frame and views_index
+        self.cycle_views = {}
+        self.views_frame = None
+        self.views_index = None
+        #Superseded workers are kept until their thread finishes
+        self.workers = []
 
         self.setWindowTitle("Graph Cycle")
         screen_geometry = QApplication.desktop().screenGeometry()
@@ -42,6 +201,12 @@ class CapacityAnalysis(QMainWindow):
         home_action.triggered.connect(self.on_home_clicked)
         plot_panel.addWidget(self.toolbar1)
         plot_panel.addWidget(self.canvas1)
+        #Cut markers can be dragged, previewing metrics until released
+        self.cut_lines = {}
+        self.drag = None
+        self.canvas1.mpl_connect('button_press_event', self.start_cut_drag)
+        self.canvas1.mpl_connect('motion_notify_event', self.drag_cut)
+        self.canvas1.mpl_connect('button_release_event', self.release_cut_drag)
 
         # Bottom plot (Accumulated CO2 Absorbed)
         self.figure2 = Figure(figsize=(12, 3))
@@ -129,6 +294,25 @@ class CapacityAnalysis(QMainWindow):
             self.cut_regression_end)
         self.regression_end_input_previous = ''
 
+        # Regression window optimizer: minimum window length and point count
+        optimizer_layout = QHBoxLayout()
+        optimizer_layout.addWidget(QLabel("Min Window:"))
+        self.optimizer_minutes_input = QLineEdit('5')
+        self.optimizer_minutes_input.setFixedWidth(40)
+        self.optimizer_minutes_input.setToolTip("Shortest regression window [min]")
+        optimizer_layout.addWidget(self.optimizer_minutes_input)
+        optimizer_layout.addWidget(QLabel("min,"))
+        self.optimizer_points_input = QLineEdit('10')
+        self.optimizer_points_input.setFixedWidth(40)
+        self.optimizer_points_input.setToolTip("Fewest rows in a regression window")
+        optimizer_layout.addWidget(self.optimizer_points_input)
+        optimizer_layout.addWidget(QLabel("points"))
+        optimizer_layout.addStretch()
+        cycle_groupbox_layout.addLayout(optimizer_layout)
+        self.suggest_button = QPushButton("Suggest Regression Windows")
+        self.suggest_button.clicked.connect(self.suggest_regression_windows)
+        cycle_groupbox_layout.addWidget(self.suggest_button)
+
         cycle_groupbox.setLayout(cycle_groupbox_layout)
         control_panel.addWidget(cycle_groupbox)
         
@@ -285,6 +469,108 @@ class CapacityAnalysis(QMainWindow):
                 self.regression_start_input_previous = ''
                 pass
     
+    ##  ---- start_cut_drag, drag_cut, release_cut_drag
+    ##  Dragging a cut marker blits it with a readout of the cycle's metrics,
+    ##  from CycleSums; releasing commits it through the override box
+
+    def start_cut_drag(self, event):
+        if event.inaxes is not self.ax1 or event.button != 1 or self.toolbar1.mode \
+                or self.calculating() or not self.cut_lines:
+            return
+        #Nearest marker, the one drawn on top where they overlap
+        distances = {column: abs(self.ax1.transData.transform(
+            (line.get_xdata()[0], 0))[0] - event.x)
+            for column, line in self.cut_lines.items()}
+        column = min(reversed(list(distances)), key=distances.get)
+        if not distances[column] <= CUT_PICK_PIXELS:
+            return
+        line = self.cut_lines[column]
+        if 'Accumulated CO2 Absorbed [mol]' not in self.df.columns:
+            return
+        self.drag = {
+            'column': column,
+            'line': line,
+            'sums': CapacityEngine.CycleSums(self.df, self.cycle_times_df,
+                                             self.cycle_index, self.current_cycle_index),
+            'params': self.run_parameters(),
+        }
+        #Everything but the marker and readout is saved once, then blitted over
+        line.set_animated(True)
+        self.cut_readout.set_animated(True)
+        self.cut_readout.set_visible(True)
+        self.canvas1.draw()
+        self.drag['background'] = self.canvas1.copy_from_bbox(self.ax1.bbox)
+        self.drag_cut(event)
+
+    def drag_cut(self, event):
+        if self.drag is None or event.inaxes is not self.ax1 or event.xdata is None:
+            return
+        minutes = float(event.xdata)
+        self.drag['line'].set_xdata([minutes, minutes])
+        cuts = [list(values) for values in (self.start_cuts, self.end_cuts,
+                self.regression_start_cuts, self.regression_end_cuts)]
+        cuts[CapacityEngine.CUT_TIME_COLUMNS.index(self.drag['column'])]\
+            [self.current_cycle_index] = minutes
+        resolved = CapacityEngine.cut_times(self.df, self.cycle_times_df, self.cycle_index,
+            self.drag['params'], cuts, [self.current_cycle_index + 1])
+        metrics = CapacityEngine.cycle_metrics(self.drag['sums'], self.drag['params'],
+                                               resolved.iloc[0].to_numpy(dtype=float))
+        self.cut_readout.set_text(
+            f"{self.drag['column']} = {minutes:.2f} min\n"
+            f"Capacity % to KPI: {metrics['Capacity % to KPI']:.4f}\n"
+            f"Sorbent Capacity: {metrics['Sorbent Capacity [gCO2/gSorbent]']:.4f} gCO2/g\n"
+            f"K (Dry): {metrics['Rate Constant K (Dry)']:.4f}\n"
+            f"K (Wet): {metrics['Rate Constant K (Wet)']:.4f}\n"
+            f"R²: {metrics['Wet Kinetics Regression R2']:.4f}")
+        self.canvas1.restore_region(self.drag['background'])
+        self.ax1.draw_artist(self.drag['line'])
+        self.ax1.draw_artist(self.cut_readout)
+        self.canvas1.blit(self.ax1.bbox)
+
+    def release_cut_drag(self, event):
+        if self.drag is None:
+            return
+        drag, self.drag = self.drag, None
+        drag['line'].set_animated(False)
+        self.cut_readout.set_animated(False)
+        self.cut_readout.set_visible(False)
+        self.canvas1.draw()
+        #The override box validates and recalculates, as if typed
+        override, handler = CUT_OVERRIDES[drag['column']]
+        getattr(self, override).setText(f"{drag['line'].get_xdata()[0]:.2f}")
+        getattr(self, handler)()
+
+    def suggest_regression_windows(self):
+        """Offer each cycle's best R2 regression window as its regression cuts"""
+        if self.calculating() or 'Accumulated CO2 Absorbed [mol]' not in self.df.columns:
+            return
+        try:
+            min_minutes = float(self.optimizer_minutes_input.text())
+            min_points = int(self.optimizer_points_input.text())
+        except ValueError:
+            self.analysis.parameter_status.setStyleSheet("color: red")
+            self.analysis.parameter_status.setText(
+                "Error: Min Window needs a number of minutes and points")
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            suggestions = CapacityEngine.best_regression_windows(
+                self.df, self.cycle_times_df, self.cycle_index, min_minutes, min_points)
+        finally:
+            QApplication.restoreOverrideCursor()
+        suggestions = suggestions.dropna()
+        dialog = RegressionSuggestions(self, suggestions, self.cycle_times_df)
+        if not dialog.exec_() or not dialog.accepted_positions:
+            return
+        for position in dialog.accepted_positions:
+            self.regression_start_cuts[position] = \
+                round(float(suggestions.loc[position, 'Regression Start Cut']), 4)
+            self.regression_end_cuts[position] = \
+                round(float(suggestions.loc[position, 'Regression End Cut']), 4)
+        self.analysis.parameter_status.setText("Status: App State Changed (unsaved)")
+        self.push_state()
+        self.propagate_change()
+
     def update_selection(self):
         #Save graph state
         xlims = (tuple(float(x) for x in self.ax1.get_xlim()))
@@ -295,10 +581,7 @@ class CapacityAnalysis(QMainWindow):
 
     def propagate_change(self, all=False):
         self.pull_state()
-        self.calculate_sorption()
-        self.calculate_kinetics_dry()
-        self.calculate_kinetics_wet()
-        self.update_plots()
+        self.start_calculation(self.update_plots)
 
     def pull_state(self):
         #Repopulate param lists
@@ -318,6 +601,7 @@ class CapacityAnalysis(QMainWindow):
 
         self.cycle_times_df = self.analysis.cycle_times_df
         self.df = self.analysis.mdf
+        self.cycle_index = self.analysis.cycle_index
         number_of_cycles = len(self.cycle_times_df)
         self.cycle_numbers = self.cycle_times_df['Cycle'].tolist()
 
@@ -331,8 +615,7 @@ class CapacityAnalysis(QMainWindow):
             self.ylim = [None] * len(self.cycle_times_df)
             print('renonned because of length')
 
-        #Secondary calculation is not dependent on cut timing
-        self.calculate_secondary()
+        self.cycle_label.setText(f'{self.cycle_numbers[self.current_cycle_index]}/{max(self.cycle_numbers)}')
 
         #Arrange timing for all four cuts
         if len(self.analysis.state_other['Start Cuts']) != number_of_cycles:
@@ -346,64 +629,125 @@ class CapacityAnalysis(QMainWindow):
             self.regression_start_cuts = self.analysis.state_other['Regression Start Cuts']
             self.regression_end_cuts = self.analysis.state_other['Regression End Cuts']
 
-        start_times = []
-        end_times = []
-        regression_start_times = []
-        regression_end_times = []
-        regression_start_percent = \
-            float(self.analysis.state_text['Regression Start (%)'])
-        regression_end_percent = float(self.analysis.state_text['Regression End (%)'])
-
-        for n in self.cycle_numbers:
-            n = int(n)
-            start_time = self.cycle_times_df['Start'][n-1]
-            end_time = self.cycle_times_df['End'][n-1]
-
-            if self.start_cuts[n-1] is not None:
-                start_cut = self.start_cuts[n-1] 
-                start_cut_time = start_time + pd.to_timedelta(start_cut,unit='m')
-            else: 
-                start_cut = 0
-                start_cut_time = start_time
-
-            #First cut between the start cut and end of data to find regression points
-            f = self.df[(self.df.index > start_cut_time) & (self.df.index < end_time)]
-            if 'Cycle Identifier' in self.df.columns:
-                f = f[(f['Cycle Identifier'] == 3) & \
-                            (f['No Completed Cycles'] == n)]    
-            regression_start_time_percent = \
-                f[f['yCO2 [%]'] > regression_start_percent].index.min()
-            regression_end_time_percent = \
-                f[(f['yCO2 [%]'] > regression_end_percent) & \
-                (f.index > regression_start_time_percent)].index.min()
-            
-            if self.end_cuts[n-1] is not None:
-                end_cut = self.end_cuts[n-1]
-            else: end_cut = ((regression_end_time_percent - start_time)\
-                .total_seconds()/60)
-            if self.regression_start_cuts[n-1] is not None:
-                regression_start_cut = self.regression_start_cuts[n-1]
-            else: regression_start_cut = min(max((regression_start_time_percent-start_time)\
-                .total_seconds()/60, start_cut),end_cut)
-            if self.regression_end_cuts[n-1] is not None:
-                regression_end_cut = self.regression_end_cuts[n-1]
-            else: regression_end_cut = min((regression_end_time_percent-start_time)\
-                .total_seconds()/60, end_cut)
-
-            start_times.append(start_cut)
-            end_times.append(end_cut)
-            regression_start_times.append(regression_start_cut)
-            regression_end_times.append(regression_end_cut)
-
-        self.cycle_times_df['Sorption Start Time'] = start_times 
-        self.cycle_times_df['Sorption End Time'] = end_times
-        self.cycle_times_df['Regression Start Time'] = regression_start_times
-        self.cycle_times_df['Regression End Time'] = regression_end_times
-
         #Unblock signals from dropdowns
         self.ax1_param_list.blockSignals(False)
         self.reactor_param_list.blockSignals(False)
 
+    def calculating(self):
+        return self.worker is not None
+
+    def start_calculation(self, on_finished, on_progress=None, on_failed=None):
+        """Recalculate on a worker thread, superseding any calculation in flight
+
+        The frames stay as they are until the worker finishes, then its
+        results replace them at once and on_finished() refreshes the widgets.
+        If it fails, on_failed() runs before the error is shown.
+        """
+        if self.worker is not None:
+            self.worker.cancel()
+        #Only recalculates what depends on changed parameters or cuts
+        if self.calculator is None or not self.calculator.is_for(
+                self.df, self.cycle_times_df, self.cycle_index):
+            self.calculator = CapacityEngine.RunCalculator(
+                self.df, self.cycle_times_df, self.cycle_index)
+        #Cuts are copied, as the cut lists keep changing while it runs
+        cuts = [list(values) for values in (self.start_cuts, self.end_cuts,
+                self.regression_start_cuts, self.regression_end_cuts)]
+        self.worker = CalculationWorker(self.calculator, self.run_parameters(), cuts,
+                                        on_finished, on_progress, on_failed)
+        self.worker.progress.connect(self.calculation_progress)
+        self.worker.calculated.connect(self.apply_calculation)
+        self.worker.failed.connect(self.calculation_failed)
+        self.worker.finished.connect(self.remove_worker)
+        self.workers.append(self.worker)
+        self.worker.start()
+
+    def calculation_progress(self, worker, done, total):
+        if worker is self.worker and worker.on_progress is not None:
+            worker.on_progress(done, total)
+
+    def apply_calculation(self, worker):
+        """Swap in a finished worker's frames, unless it was superseded"""
+        if worker is not self.worker:
+            return
+        self.worker = None
+        #Frames reloaded while it ran make its results stale
+        if worker.source is not self.calculator or not self.calculator.is_for(
+                self.analysis.mdf, self.analysis.cycle_times_df, self.analysis.cycle_index):
+            return
+        self.calculator = worker.calculator
+        self.adopt_cycle_views(self.calculator.df, self.calculator.recalculated)
+        self.analysis.column_statistics().adopt(self.calculator.df,
+                                                self.calculator.recalculated)
+        self.df = self.analysis.mdf = self.calculator.df
+        self.cycle_times_df = self.analysis.cycle_times_df = self.calculator.cycle_times_df
+        worker.on_finished()
+        self.analysis.overview_instance.refresh()
+
+    def cycle_view(self, position):
+        """CycleView of a cycle, built once per load of the frames"""
+        if self.views_frame is not self.df or self.views_index is not self.cycle_index:
+            self.cycle_views = {}
+            self.views_frame = self.df
+            self.views_index = self.cycle_index
+        if position not in self.cycle_views:
+            self.cycle_views[position] = CycleView(self.cycle_index, position)
+        return self.cycle_views[position]
+
+    def adopt_cycle_views(self, df, recalculated):
+        """Carry the cycle views over to a calculation's df
+
+        Only cycles whose columns it recalculated drop their cached columns.
+        """
+        if self.views_frame is not self.df:
+            return
+        if 'secondary' in recalculated:
+            stale = None
+        else:
+            stale = recalculated.get('wet', set())
+        for position, view in self.cycle_views.items():
+            if stale is None or position in stale:
+                view.columns = {}
+        self.views_frame = df
+
+    def calculation_failed(self, worker, message):
+        if worker is not self.worker:
+            return
+        self.worker = None
+        if worker.on_failed is not None:
+            worker.on_failed()
+        self.analysis.secondary_status.setStyleSheet("color: red")
+        self.analysis.secondary_status.setText(f'Status: Calculation failed – {message}')
+
+    def remove_worker(self):
+        #finished arrives just before the thread exits, so wait for it first
+        worker = self.sender()
+        worker.wait()
+        self.workers.remove(worker)
+
+    def update_live(self, first_row, cycles):
+        """Recalculate rows appended in live mode and the cycles they touch"""
+        self.df = self.analysis.mdf
+        self.cycle_index = self.analysis.cycle_index
+        self.cycle_times_df = self.analysis.cycle_times_df
+        self.cycle_numbers = self.cycle_times_df['Cycle'].tolist()
+
+        #New cycles start out without cuts or saved graph limits
+        for values in (self.start_cuts, self.end_cuts, self.regression_start_cuts,
+                       self.regression_end_cuts, self.xlim, self.ylim):
+            values.extend([None] * (len(self.cycle_numbers) - len(values)))
+        self.analysis.state_other['Start Cuts'] = self.start_cuts
+        self.analysis.state_other['End Cuts'] = self.end_cuts
+        self.analysis.state_other['Regression Start Cuts'] = self.regression_start_cuts
+        self.analysis.state_other['Regression End Cuts'] = self.regression_end_cuts
+        self.analysis.state_other['Cycle Graph Xlim'] = self.xlim
+        self.analysis.state_other['Cycle Graph Ylim'] = self.ylim
+
+        self.cycle_label.setText(f'{self.cycle_numbers[self.current_cycle_index]}/{max(self.cycle_numbers)}')
+        self.calculator.append(self.df, self.cycle_times_df, self.cycle_index,
+                               first_row, cycles)
+        self.update_plots()
+
     def push_state(self):
         selected_labels = [item.text() for item in self.ax1_param_list.selectedItems()]
         selected_params = [item.text() for item in self.reactor_param_list.selectedItems()]
@@ -451,23 +795,18 @@ class CapacityAnalysis(QMainWindow):
         self.regression_end_override.setText(rend_override_text)
         self.regression_end_input_previous = rend_override_text
 
-        #Plot Setup
+        #Plot Setup, dropping any drag of the cleared markers
+        self.drag = None
         self.figure1.clear()
 
         self.ax1 = self.figure1.add_subplot(111)
         n = self.cycle_numbers[self.current_cycle_index]
         start_time = self.cycle_times_df['Start'][self.current_cycle_index]
-        start_cut = start_time + pd.to_timedelta(\
-            self.cycle_times_df['Sorption Start Time'][n-1],unit='m')
-        end_cut = start_time + pd.to_timedelta(\
-            self.cycle_times_df['Sorption End Time'][n-1],unit='m')
-        if 'No Completed Cycles' in self.df.columns:
-            f = self.df[self.df['No Completed Cycles'] == n]
-        else:
-            f = self.df
-        f_cut_left = f[(f.index <= start_cut)]
-        f_cut_right = f[(f.index >= end_cut)]
-        f_center = f[(f.index > start_cut) & (f.index < end_cut)]
+        view = self.cycle_view(int(n)-1)
+        parts = view.split(start_time, self.cycle_times_df[
+            CapacityEngine.CUT_TIME_COLUMNS].iloc[int(n)-1].tolist())
+        minutes = view.minutes
+        left, center, right = parts['left'], parts['center'], parts['right']
 
         # Get selected ax1 and reactor param list elements
         selected_labels = [item.text() for item in self.ax1_param_list.selectedItems()]\
@@ -478,34 +817,30 @@ class CapacityAnalysis(QMainWindow):
         #Populate scaling dict and labels
         if use_scaling and selected_labels:
             self.ax1.set_ylim(-2,12)
-            scaling_factors = {}
-            for label in selected_labels:
-                scaling_factors[label] = self.calculate_scaling_factors(\
-                    f, [label], start_cut, end_cut).get(label, 1)
+            scaling_factors = self.calculate_scaling_factors(
+                int(n)-1, view.windows['sorption'], selected_labels)
         #Plot elements which are to be autoscaled
         for label in selected_labels:
-            if label in f_center.columns:
-                ydata = f_center[label]
+            if label in self.df.columns:
+                ydata = view.column(self.df, label)[center]
                 if use_scaling and scaling_factors and label in scaling_factors:
                     ydata = ydata / scaling_factors[label]
                     plot_label = f"{label} / {scaling_factors[label]:.2f}"
                 else:
                     plot_label = label
-                self.ax1.plot((f_center.index - f.index[0]).total_seconds()/60, ydata,\
-                          label=plot_label)
+                self.ax1.plot(minutes[center], ydata, label=plot_label)
         self.ax1.autoscale(axis='y')
         #Plot left and right cut elements (not to be autoscaled)
         for label in selected_labels:
-            if label in f_center.columns:
-                ydata_left = f_cut_left[label]
-                ydata_right = f_cut_right[label]
+            if label in self.df.columns:
+                ydata = view.column(self.df, label)
+                ydata_left = ydata[left]
+                ydata_right = ydata[right]
                 if use_scaling and scaling_factors and label in scaling_factors:
                     ydata_left = ydata_left / scaling_factors[label]
                     ydata_right = ydata_right / scaling_factors[label]
-                self.ax1.plot((f_cut_left.index - f.index[0]).total_seconds()/60,\
-                            ydata_left, color='grey', linestyle=':')
-                self.ax1.plot((f_cut_right.index - f.index[0]).total_seconds()/60,\
-                            ydata_right, color='grey', linestyle=':')
+                self.ax1.plot(minutes[left], ydata_left, color='grey', linestyle=':')
+                self.ax1.plot(minutes[right], ydata_right, color='grey', linestyle=':')
         
         # cut_time = start + pd.to_timedelta(float_val, unit='m')
         regression_start_rel = self.cycle_times_df['Regression Start Time'][n-1]
@@ -526,25 +861,33 @@ class CapacityAnalysis(QMainWindow):
         if residence_time_color is None:
             residence_time_color = 'red'
 
-        #Draw vertical lines
-        self.ax1.axvline(x=sorption_start_rel,
+        #Draw vertical lines, kept to be dragged
+        self.cut_lines = {}
+        self.cut_lines['Sorption Start Time'] = self.ax1.axvline(x=sorption_start_rel,
             label=f'Sorption Start = {sorption_start_rel:.1f}min',
             color=yco2_color)
-        if float(sorption_end_rel): self.ax1.axvline(x=sorption_end_rel,
+        if float(sorption_end_rel):
+            self.cut_lines['Sorption End Time'] = self.ax1.axvline(x=sorption_end_rel,
             label=f'Sorption End = {sorption_end_rel:.1f}min',
             color=yco2_color)
-        if float(regression_start_rel):\
-            self.ax1.axvline(x=regression_start_rel, linestyle=(0,(5,10)),
+        if float(regression_start_rel):
+            self.cut_lines['Regression Start Time'] = self.ax1.axvline(
+            x=regression_start_rel, linestyle=(0,(5,10)),
             label=f"Regression Start = {self.analysis.state_text['Regression Start (%)']}%"\
             if self.regression_start_cuts[self.current_cycle_index] is None else \
             f"Regression Start = {regression_start_rel:.1f}min",
             color=residence_time_color)
-        if float(regression_end_rel):\
-            self.ax1.axvline(x=regression_end_rel, linestyle=(0,(5,10)),
+        if float(regression_end_rel):
+            self.cut_lines['Regression End Time'] = self.ax1.axvline(
+            x=regression_end_rel, linestyle=(0,(5,10)),
             label=f"Regression End = {self.analysis.state_text['Regression End (%)']}%"\
             if self.regression_end_cuts[self.current_cycle_index] is None else \
             f"Regression End = {regression_end_rel:.1f}min",
             color=residence_time_color)
+        #Metrics readout, only shown while dragging a cut
+        self.cut_readout = self.ax1.text(0.01, 0.98, '', transform=self.ax1.transAxes,
+            va='top', ha='left', fontsize=9,
+            bbox=dict(boxstyle='round', facecolor='white', alpha=0.8), visible=False)
         
         
         #Config labels and legend
@@ -553,7 +896,6 @@ class CapacityAnalysis(QMainWindow):
         self.ax1.legend()
         self.ax1.grid(True)
         self.figure1.tight_layout(pad=1)
-        self.canvas1.draw()
 
         #Scaling config for plot 1
         if self.xlim[self.current_cycle_index] is not None:
@@ -569,16 +911,11 @@ class CapacityAnalysis(QMainWindow):
         self.figure2.clear()
         ax2 = self.figure2.add_subplot(111)
 
-        # Retrim
-        # cut_time = start + pd.to_timedelta(float_val, unit='m')
-        start_time = self.cycle_times_df['Start'][self.current_cycle_index]
-        start_cut = start_time + pd.to_timedelta(\
-            self.cycle_times_df['Regression Start Time'][n-1],unit='m')
-        end_cut = start_time + pd.to_timedelta(\
-            self.cycle_times_df['Regression End Time'][n-1],unit='m')
-        f_center = f[(f.index > start_cut) & (f.index < end_cut)]
-        if 'Accumulated CO2 Absorbed [mol]' in f.columns:
-            ax2.plot(f_center['Residence Time [s]'], f_center['ln[CO2]'],\
+        # Retrim to the regression cuts
+        regression = parts['regression']
+        if 'Accumulated CO2 Absorbed [mol]' in self.df.columns:
+            residence_time = view.column(self.df, 'Residence Time [s]')[regression]
+            ax2.plot(residence_time, view.column(self.df, 'ln[CO2]')[regression],\
                       label=f'Cycle #{n}')
             # Plot the fitted line from cycle_times_df
             k = self.cycle_times_df['Rate Constant K (Wet)'][n-1]
@@ -586,10 +923,10 @@ class CapacityAnalysis(QMainWindow):
             r2 = self.cycle_times_df['Wet Kinetics Regression R2'][n-1]\
                 if 'Wet Kinetics Regression R2' in self.cycle_times_df.columns else None
             if isfinite(k): #and isfinite(lnco2_t0):
-                x_fit = f_center['Residence Time [s]'].values
-                y_fit = (-k * x_fit) +  self.constant_lnco2_0
+                x_fit = residence_time
+                y_fit = (-k * x_fit) +  CapacityEngine.CONSTANT_LNCO2_0
                 #lnco2_t0  # Correct sign for -k
-                label = f"Fit: ln[CO2] = -{k:.3f}·t + {self.constant_lnco2_0:.3f}\
+                label = f"Fit: ln[CO2] = -{k:.3f}·t + {CapacityEngine.CONSTANT_LNCO2_0:.3f}\
                     (R² = {r2:.3f})" if r2 is not None and isfinite(r2)\
                     else "Fit: ln[CO2] = -k·t + ln[CO2]_0"
                 ax2.plot(x_fit, y_fit, '--', color='red', label=label)
@@ -601,242 +938,11 @@ class CapacityAnalysis(QMainWindow):
         self.figure2.tight_layout(pad=1)
         self.canvas2.draw()
 
-    def calculate_secondary(self):
-        """Calculate variables which only depend on df"""
-        print('calculating secondary')
-
-        self.df['TimeDiff'] = self.df.index.diff()
-        self.cycle_label.setText(f'{self.cycle_numbers[self.current_cycle_index]}/{max(self.cycle_numbers)}')
-
-        reactor_pressure = 101325 #Pa
-        gas_constant_r = 8.3145
-        reactor_temp_c = 55
-        reactor_temp_k = reactor_temp_c + 273.15
-        sccm_to_molar = reactor_pressure * (1e-6) / (60) / gas_constant_r / 273.15
+    def run_parameters(self):
+        """Typed run parameters from the main window's inputs"""
+        return CapacityEngine.RunParameters.from_state(
+            self.analysis.state_text, self.analysis.reference_gas_dropdown.currentText())
 
-        ref_gas = self.analysis.reference_gas_dropdown.currentText()
-        gas_abbr = self.analysis.gas_abbr  # Use the lookup from analysis
-        abbr = gas_abbr.get(ref_gas, ref_gas)
-
-        if ref_gas in self.df.columns:
-            self.df['CO2 / ' + abbr] = self.df['Carbon dioxide'] / self.df[ref_gas]
-            co2_ref_col = 'CO2 / ' + abbr
-        else:
-            # fallback to Nitrogen if not found
-            self.df['CO2 / N2'] = self.df['Carbon dioxide'] / self.df['Nitrogen']
-            co2_ref_col = 'CO2 / N2'
-
-        correction = float(self.analysis.state_text['Reactor Input Ratio (%)'])\
-            /float(self.analysis.state_text['QMS Input Ratio (%)'])  
-        self.df['yCO2 [%]'] = self.df[co2_ref_col] * correction * 100
-        input_flow_rate_sccm = float(self.analysis.state_text['Input Flow Rate [SCCM]'])
-        input_flow_rate_molar = input_flow_rate_sccm * sccm_to_molar
-        co2_input_flow_rate_molar = input_flow_rate_molar\
-              * float(self.analysis.state_text['Reactor Input Ratio (%)']) / 100
-        self.df['[CO2]']=self.df['yCO2 [%]']/100*reactor_pressure\
-            /gas_constant_r/reactor_temp_k
-        self.df['ln[CO2]'] = log(self.df['[CO2]'])
-        self.df['CO2 Partial Flow Rate Out [mol/s]']\
-              = self.df['yCO2 [%]']/100* input_flow_rate_molar
-        self.df['CO2 Absorbed [mol]']\
-              = maximum((co2_input_flow_rate_molar\
-                          - self.df['CO2 Partial Flow Rate Out [mol/s]'])\
-                              * self.df['TimeDiff'].dt.total_seconds(), 0)
-        return
-
-    def calculate_sorption(self):
-        """Calculate variables which rely on df and cycle_times_df"""
-
-        #Preliminary calculations
-        co2_molar_mass = 44.01
-        sorbent_vol = float(self.analysis.state_text['Sorbent Mass [g]'])\
-              / float(self.analysis.state_text['Sorbent Bulk Density [g/mL]'])
-        sorbent_mass = float(self.analysis.state_text['Sorbent Mass [g]'])
-        
-        #Instantiate return lists
-        min_gammas = []
-        total_absorbed = []
-        duration_seconds = []
-
-        #Calculate capacity for each cycle in the run
-        for n in self.cycle_numbers:
-            #Prep data frame
-            f = self.df
-            #If using baldy3 data, further trim set
-            if 'Cycle Identifier' in self.df.columns:
-                f = self.df[(self.df['Cycle Identifier'] == 3) & \
-                            (self.df['No Completed Cycles'] == n)]
-            #Cut the single cycle dataframe based on sorption_start/end_cut
-            start_time = self.cycle_times_df['Start'][n-1]
-            start_cut = start_time + pd.to_timedelta(\
-                self.cycle_times_df['Sorption Start Time'][n-1],unit='m')
-            end_cut = start_time + pd.to_timedelta(\
-                self.cycle_times_df['Sorption End Time'][n-1],unit='m')
-            f = f[(f.index > start_cut) & (f.index < end_cut)]
-            f_absorbed = f[(f.index > start_cut) & (f.index < end_cut)]
-            total_absorbed.append(sum(f_absorbed['CO2 Absorbed [mol]']))
-            min_gammas.append(f['yCO2 [%]'][f['yCO2 [%]'] > 0].min()/100)
-            duration_seconds.append((end_cut - start_cut).total_seconds())
-
-        sorption_durations = [
-            f"{int(ds // 3600)}:{int((ds % 3600) // 60):02d}:{int(ds % 60):02d}"\
-                if pd.notna(ds) else nan
-            for ds in duration_seconds
-        ]
-
-        #Push return lists to the cycle times dataframe
-        self.cycle_times_df['Sorption Duration'] = sorption_durations
-        self.cycle_times_df['Highest Sorption Point'] = min_gammas
-        self.cycle_times_df['Experimental CO2absorbed [mol]'] = total_absorbed
-        self.cycle_times_df['Experimental CO2absorbed [g]']\
-              = self.cycle_times_df['Experimental CO2absorbed [mol]'] * co2_molar_mass
-        self.cycle_times_df['Sorbent Capacity [gCO2/gSorbent]']\
-              = self.cycle_times_df['Experimental CO2absorbed [g]'] / sorbent_mass
-        self.cycle_times_df['Sorbent Capacity [gCO2/mLReactor]']\
-              = self.cycle_times_df['Experimental CO2absorbed [g]'] / sorbent_vol
-        self.cycle_times_df['Capacity % to KPI']\
-              = self.cycle_times_df['Sorbent Capacity [gCO2/mLReactor]'] / 0.0283
-              # ABOVE CONSTANT PULLED FROM EXCEL, UNSURE OF ORIGIN
-
-    def calculate_kinetics_dry(self):
-        """Uses the dry kinetics model to calculate the Rate Constant K"""        
-        #Define constants 
-        reactor_pressure = 101325 #pa
-        reactor_temp_c = 55
-        reactor_temp_k = reactor_temp_c + 273
-        gas_constant_r = 8.3145
-        rh_before_reaction = 100
-        h20_molar_mass = 18.02
-        inch_to_meter = 0.0254
-        sccm_to_molar = reactor_pressure * (1e-6) / (60) / gas_constant_r / 273.15
-        
-        #Propagate calculations using program inputs
-        input_flow_rate_sccm = float(self.analysis.state_text['Input Flow Rate [SCCM]'])
-        input_flow_rate_molar = input_flow_rate_sccm * sccm_to_molar
-        input_flow_rate_meter = input_flow_rate_molar * 8.3145 * reactor_temp_k\
-              / reactor_pressure
-        co2_flow_rate_sccm = input_flow_rate_sccm\
-              * float(self.analysis.state_text['Reactor Input Ratio (%)']) / 100
-        co2_flow_rate_molar = co2_flow_rate_sccm * sccm_to_molar
-        reactor_area = pi*((float(self.analysis.state_text['Reactor Diameter [in]'])\
-              * inch_to_meter / 2)**2)
-        sorbent_vol = float(self.analysis.state_text['Sorbent Mass [g]'])\
-              / float(self.analysis.state_text['Sorbent Bulk Density [g/mL]'])
-        packing_length_cm = sorbent_vol\
-              / (pi * (float(self.analysis.state_text['Reactor Diameter [in]'])\
-              * inch_to_meter * 50)**2)
-        packing_volume = reactor_area * packing_length_cm / 100
-        residence_time = packing_volume / input_flow_rate_meter
-        ah_before_reaction_gm3 = 6.112 * (e ** ((17.67*reactor_temp_c)\
-              /(reactor_temp_c+243.5))) * rh_before_reaction * h20_molar_mass \
-              / reactor_temp_k / 100 / 0.08314
-        ah_before_reaction = ah_before_reaction_gm3 / h20_molar_mass
-        co2_fraction_before = float(self.analysis.state_text['Reactor Input Ratio (%)'])\
-              / 100
-        
-        #Below will be arrays if there are multiple cycles
-        co2_fraction_after = self.cycle_times_df['Highest Sorption Point']
-        co2_consumed = co2_flow_rate_molar * (co2_fraction_before - co2_fraction_after)\
-            / co2_fraction_before / input_flow_rate_meter
-        ah_after_reaction = ah_before_reaction - co2_consumed
-        co2_before_reaction = co2_flow_rate_molar / input_flow_rate_meter
-        co2_after_reaction = co2_before_reaction - co2_consumed
-        rate_constant_k_dry = (log(co2_after_reaction / ah_after_reaction)\
-             - log(co2_before_reaction / ah_before_reaction))\
-             / (ah_before_reaction - co2_before_reaction) / (-residence_time)
-        
-        #Push the rate constant to cycle_times_df
-        self.cycle_times_df['Rate Constant K (Dry)'] = rate_constant_k_dry
-
-    def calculate_kinetics_wet(self):
-        """Uses the wet kinetics odel to calculate the Rate Constant K and related"""
-        cycle_times_df = self.cycle_times_df
-        df = self.df
-
-        #Setup new columns to be populated
-        df['Accumulated CO2 Absorbed [mol]'] = nan
-        df['Volume of Active Sorbent [mL]'] = nan
-        df['Residence Time [s]'] = nan
-        rate_constants = []
-        r2s = []
-
-        #Calculate some experimental constants which are not cycle specific
-        sorbent_vol = float(self.analysis.state_text['Sorbent Mass [g]'])\
-              / float(self.analysis.state_text['Sorbent Bulk Density [g/mL]'])
-        co2_molar_mass = 44.01
-        self.constant_lnco2_0 = 1.312488772
-
-        #Perform calculations by iterating across each cycle
-        for idx, n in enumerate(self.cycle_numbers):
-            if 'No Completed Cycles' in df.columns:
-                f = df[df['No Completed Cycles'] == n]
-            else:
-                f = df
-            #Masking from beginning of sorption to end of integration
-            cycle_start = cycle_times_df['Start'][n-1]
-            # cut_time = start + pd.to_timedelta(float_val, unit='m')
-            start_time = cycle_start + pd.to_timedelta(\
-                cycle_times_df['Sorption Start Time'][n-1],unit='m')
-            end_time = cycle_start + pd.to_timedelta(\
-                cycle_times_df['Regression End Time'][n-1],unit='m')
-            
-            mask = (f.index >= start_time) & (f.index <= end_time)
-            # Compute cumulative sum for the masked slice
-            absorbed_cumsum = f.loc[mask, 'CO2 Absorbed [mol]'].cumsum()
-            if len(absorbed_cumsum > 0):
-                sorbent_active_volume = sorbent_vol - \
-                    (absorbed_cumsum * co2_molar_mass \
-                     / (absorbed_cumsum.iloc[-1] * co2_molar_mass/ sorbent_vol))
-            else: 
-                sorbent_active_volume = sorbent_vol - \
-                    (absorbed_cumsum * co2_molar_mass \
-                    / cycle_times_df['Sorbent Capacity [gCO2/mLReactor]'][n-1])
-            residence_time = sorbent_active_volume\
-                  / float(self.analysis.state_text['Input Flow Rate [SCCM]']) * 60
-            # Insert the cumulative sum into the main df for the same indices
-            df.loc[f.loc[mask].index, 'Accumulated CO2 Absorbed [mol]']\
-                  = absorbed_cumsum
-            df.loc[f.loc[mask].index, 'Volume of Active Sorbent [mL]']\
-                  = sorbent_active_volume
-            df.loc[f.loc[mask].index, 'Residence Time [s]'] = residence_time
-
-            # Further trim the area to within the regression region
-            # cut_time = start + pd.to_timedelta(float_val, unit='m')
-            start_time = cycle_start + pd.to_timedelta(\
-                cycle_times_df['Regression Start Time'][n-1],unit='m')
-            end_time = cycle_start + pd.to_timedelta(\
-                cycle_times_df['Regression End Time'][n-1],unit='m')
-
-            f = f[(f.index > start_time) & (f.index < end_time)]
-            # Linear regression: ln[CO2] = -k*t + intercept
-            x = residence_time[f.index].values
-            y = f['ln[CO2]'].values
-            if len(x) > 1:
-                # Force fit with constant y-intercept (constant_lnco2_0)
-                # y = -k * x + constant_lnco2_0 => y - constant_lnco2_0 = -k * x
-                y_adj = y - self.constant_lnco2_0
-                # Fit slope only
-                try:
-                    slope, _, r_value, p_value, std_err = linregress(x, y_adj)
-                    rate_constant_k = -slope
-                    regression_r2 = r_value ** 2
-                except ValueError:
-                    rate_constant_k = 0
-                    regression_r2 = 0
-                # lnCO2_t0 = constant_lnco2_0  # Forced intercept
-            else:
-                rate_constant_k = nan
-                regression_r2 = nan
-            # Save to lists for this cycle
-            rate_constants.append(rate_constant_k)
-            # lnco2_t0s.append(lnCO2_t0)
-            r2s.append(regression_r2)
-        # Save to cycle_times_df for all cycles
-        self.cycle_times_df['Rate Constant K (Wet)'] = rate_constants
-        # self.cycle_times_df['lnCO2_t0'] = lnco2_t0s
-        self.cycle_times_df['Wet Kinetics Regression R2'] = r2s
-        return
-    
     #Function to override home button function in matplotlib toolbox
     def on_home_clicked(self):
         self.ax1.autoscale()
@@ -872,14 +978,14 @@ class CapacityAnalysis(QMainWindow):
             self.update_plots()
             
     #Calculate scaling factors for selected columns based on sorption range
-    def calculate_scaling_factors(self, f, selected_cols, sorption_start, sorption_end):
-        # Only describe numeric columns in the sorption range
-        describe_df = f.loc[(f.index >= sorption_start) & (f.index <= sorption_end)\
-                            , selected_cols].select_dtypes(include=[number]).describe()
-        scaling = (describe_df.loc['max']).apply(
-            lambda x: 10**(floor(log10(abs(x)))) if x != 0 else 1
-        ).fillna(1)
-        return scaling.to_dict()
+    def calculate_scaling_factors(self, position, rows, selected_cols):
+        # Only numeric columns, over rows of the cycle's sorption range
+        column_stats = self.analysis.column_statistics()
+        scaling = {}
+        for col in selected_cols:
+            stats = column_stats.cycle(col, position, rows)
+            scaling[col] = 1 if stats is None else stats.scaling_factor()
+        return scaling
 
     def get_all_figures_for_pdf(self):
         """Return a list of matplotlib Figure objects for all cycles"""
@@ -0,0 +1,870 @@
+from typing import NamedTuple
+from collections import OrderedDict
+import pandas as pd
+from numpy import nan, maximum, minimum, pi, e, log, sqrt, clip, where, isnan, isnat, \
+    searchsorted, arange, array, full, zeros, unique, cumsum, repeat, add, concatenate, \
+    sort, r_, intp, errstate, flatnonzero, isfinite, ones, argsort, linspace
+from CycleIndex import row_positions
+
+# Run parameters as entered in the GUI (and saved in run_parameters.csv)
+DEFAULT_STATE_TEXT = {
+    "Sorbent Mass [g]": "",
+    "Reactor Diameter [in]": "0.8",
+    "Sorbent Bulk Density [g/mL]": "",
+    "Input Flow Rate [SCCM]": "150",
+    "Packing Factor": "0.55",
+    "Reactor Input Ratio (%)": "10",
+    "QMS Input Ratio (%)": "",
+    "Regression Start (%)": "0.5",
+    "Regression End (%)": "9",
+}
+
+# Short names used for the CO2 / reference gas ratio column
+GAS_ABBREVIATIONS = {
+    "": "",
+    "Nitrogen": "N2",
+    "Oxygen": "O2",
+    "Argon": "Ar",
+    "Helium": "He",
+    "Hydrogen": "H2",
+    "Carbon dioxide": "CO2",
+}
+
+# Forced intercept of the wet kinetics fit of ln[CO2] against residence time
+CONSTANT_LNCO2_0 = 1.312488772
+CO2_MOLAR_MASS = 44.01
+
+CUT_TIME_COLUMNS = ['Sorption Start Time', 'Sorption End Time',
+                    'Regression Start Time', 'Regression End Time']
+WET_COLUMNS = ['Accumulated CO2 Absorbed [mol]',
+               'Volume of Active Sorbent [mL]', 'Residence Time [s]']
+
+class RunParameters(NamedTuple):
+    """Numeric run parameters, in the order of DEFAULT_STATE_TEXT"""
+    sorbent_mass: float
+    reactor_diameter: float
+    bulk_density: float
+    input_flow_rate: float
+    packing_factor: float
+    reactor_input_ratio: float
+    qms_input_ratio: float
+    regression_start: float
+    regression_end: float
+    ref_gas: str = 'Argon'
+
+    @classmethod
+    def from_state(cls, state_text, ref_gas):
+        """Parse the GUI's state_text, raising ValueError on a non-number"""
+        values = []
+        for key in DEFAULT_STATE_TEXT:
+            try:
+                values.append(float(state_text[key]))
+            except ValueError:
+                raise ValueError(f"'{key}' is not a number: '{state_text[key]}'")
+        return cls(*values, ref_gas)
+
+    @property
+    def sorbent_volume(self):
+        return self.sorbent_mass / self.bulk_density
+
+def cycle_positions(cycle_times_df, cycles):
+    """Sorted cycle_times_df rows of the cycle numbers to calculate (all when None)"""
+    if cycles is None:
+        return arange(len(cycle_times_df))
+    return unique(array([int(n) - 1 for n in cycles], dtype=intp))
+
+def minutes_after(start, minutes):
+    """Timestamps a number of minutes after each start, NaT where minutes is NaN"""
+    return start + pd.to_timedelta(minutes, unit='m').to_numpy()
+
+def total_seconds(deltas):
+    """Seconds in timedelta64 values, rounded to microseconds like Timedelta.total_seconds"""
+    microseconds = deltas.view('int64') // 1000
+    seconds = microseconds // 10**6 + microseconds % 10**6 / 1e6
+    return where(isnat(deltas), nan, seconds)
+
+def first_times(groups, times, mask, count):
+    """Earliest time per cycle position among rows where mask holds (NaT for none)"""
+    first = pd.Series(times[mask]).groupby(groups[mask]).min()
+    return first.reindex(arange(count)).to_numpy()
+
+def sorption_rows(cycle_index, position):
+    """Rows searched for a cycle's sorption window"""
+    if not cycle_index.has_identifier:
+        # Without phases the window is matched against every row by time
+        return slice(0, cycle_index.length)
+    return cycle_index.phase_rows(position, 3)
+
+def cycle_windows(cycle_index, rows_of, positions, starts, ends, inclusive=False):
+    """Rows of each cycle within its time window, in cycle order
+
+    rows_of(position) gives the rows a cycle's window is searched in, which
+    CycleIndex.windows narrows by binary search, so only those rows are read.
+    """
+    return cycle_index.windows([rows_of(position) for position in positions],
+                               starts[positions], ends[positions], inclusive, inclusive)
+
+def window_rows(windows):
+    """Row positions of cycle windows concatenated, and how many each has"""
+    parts = [row_positions(window) for window in windows]
+    counts = array([len(part) for part in parts], dtype=intp)
+    rows = concatenate(parts) if parts else array([], dtype=intp)
+    return rows, counts
+
+def column_values(df, column, rows):
+    """Float values of a column at row positions"""
+    return df[column].to_numpy()[rows].astype(float)
+
+class RunningTotals:
+    """Running totals of a column within each contiguous cycle of a run
+
+    through[i] sums the cycle's rows up to and including row i, and before[i]
+    those ahead of it, so any window of rows inside one cycle sums with two
+    lookups. Restarting at each cycle keeps the totals as precise as the
+    cycle's own sum. NaN counts as zero, as in a pandas sum; windows that
+    aren't a slice inside one cycle are summed directly.
+    """
+    def __init__(self, values, cycle_index):
+        self.missing = isnan(values)
+        self.values = where(self.missing, 0, values)
+        self.length = len(values)
+        self.cycle_starts = array([start for start, _, _ in cycle_index.cycles], dtype=intp)
+        self.cycle_stops = array([stop for _, stop, _ in cycle_index.cycles], dtype=intp)
+        self.cycles = full(self.length, -1, dtype=intp)
+        for position, (start, stop, contiguous) in enumerate(cycle_index.cycles):
+            if contiguous:
+                self.cycles[start:stop] = position
+        # Grouped cumsum is compensated, unlike numpy's
+        self.through = pd.Series(self.values).groupby(self.cycles).cumsum().to_numpy()
+        self.before = r_[0., self.through[:-1]]
+        self.before[self.cycle_starts[self.cycle_starts < self.length]] = 0
+
+    def in_one_cycle(self, windows):
+        """First rows, stops and whether each window is a slice inside one cycle"""
+        slices = array([isinstance(window, slice) for window in windows], dtype=bool)
+        lo = array([window.start if is_slice else 0
+                    for window, is_slice in zip(windows, slices)], dtype=intp)
+        hi = array([window.stop if is_slice else 0
+                    for window, is_slice in zip(windows, slices)], dtype=intp)
+        cycles = self.cycles[minimum(lo, max(self.length - 1, 0))] if self.length \
+            else full(len(windows), -1, dtype=intp)
+        inside = slices & (hi > lo) & (cycles >= 0)
+        inside &= (lo >= self.cycle_starts[cycles]) & (hi <= self.cycle_stops[cycles])
+        return lo, hi, inside
+
+    def window_sums(self, windows):
+        """Sum of each window of rows"""
+        lo, hi, inside = self.in_one_cycle(windows)
+        sums = zeros(len(windows))
+        sums[inside] = self.through[hi[inside] - 1] - self.before[lo[inside]]
+        for i in flatnonzero(~inside):
+            sums[i] = self.values[windows[i]].sum()
+        return sums
+
+    def running(self, windows):
+        """Running total from each window's first row, over window_rows(windows)
+
+        NaN rows stay NaN without resetting the total, as in a groupby cumsum.
+        """
+        rows, counts = window_rows(windows)
+        lo, _, inside = self.in_one_cycle(windows)
+        totals = self.through[rows] - repeat(where(inside, self.before[lo], 0), counts)
+        ends = cumsum(counts)
+        for i in flatnonzero(~inside & (counts > 0)):
+            part = slice(ends[i] - counts[i], ends[i])
+            totals[part] = cumsum(self.values[rows[part]])
+        return where(self.missing[rows], nan, totals)
+
+def absorbed_totals(df, cycle_index):
+    """RunningTotals of CO2 Absorbed [mol]"""
+    return RunningTotals(df['CO2 Absorbed [mol]'].to_numpy(dtype=float), cycle_index)
+
+def set_cycle_values(cycle_times_df, metrics):
+    """Write per-cycle results, indexed by cycle_times_df row, into cycle_times_df"""
+    for column in metrics.columns:
+        if len(metrics) == len(cycle_times_df):
+            cycle_times_df[column] = metrics[column].to_numpy()
+        else:
+            cycle_times_df.loc[metrics.index, column] = metrics[column].to_numpy()
+
+def reference_column(df, ref_gas):
+    """Reference gas to divide CO2 by and the name of the ratio column"""
+    if ref_gas in df.columns:
+        return ref_gas, 'CO2 / ' + GAS_ABBREVIATIONS.get(ref_gas, ref_gas)
+    # fallback to Nitrogen if not found
+    return 'Nitrogen', 'CO2 / N2'
+
+def secondary_columns(df, params, start_row=0):
+    """Variables which only depend on df, for rows start_row onwards"""
+    reactor_pressure = 101325 #Pa
+    gas_constant_r = 8.3145
+    reactor_temp_c = 55
+    reactor_temp_k = reactor_temp_c + 273.15
+    sccm_to_molar = reactor_pressure * (1e-6) / (60) / gas_constant_r / 273.15
+
+    ref_gas, co2_ref_col = reference_column(df, params.ref_gas)
+    #TimeDiff needs the row before the first calculated one
+    first_row = max(start_row - 1, 0)
+    f = df.iloc[first_row:]
+    secondary = pd.DataFrame(index=f.index)
+
+    secondary['TimeDiff'] = f.index.diff()
+    secondary[co2_ref_col] = f['Carbon dioxide'] / f[ref_gas]
+
+    correction = params.reactor_input_ratio / params.qms_input_ratio
+    secondary['yCO2 [%]'] = secondary[co2_ref_col] * correction * 100
+    input_flow_rate_molar = params.input_flow_rate * sccm_to_molar
+    co2_input_flow_rate_molar = input_flow_rate_molar\
+          * params.reactor_input_ratio / 100
+    secondary['[CO2]']=secondary['yCO2 [%]']/100*reactor_pressure\
+        /gas_constant_r/reactor_temp_k
+    secondary['ln[CO2]'] = log(secondary['[CO2]'])
+    secondary['CO2 Partial Flow Rate Out [mol/s]']\
+          = secondary['yCO2 [%]']/100* input_flow_rate_molar
+    secondary['CO2 Absorbed [mol]']\
+          = maximum((co2_input_flow_rate_molar\
+                      - secondary['CO2 Partial Flow Rate Out [mol/s]'])\
+                          * secondary['TimeDiff'].dt.total_seconds(), 0)
+    return secondary.iloc[start_row - first_row:]
+
+def cut_times(df, cycle_times_df, cycle_index, params, cuts, cycles=None):
+    """Resolve the four cut times of each cycle from overrides and yCO2 thresholds
+
+    cuts holds the start, end, regression start and regression end override
+    lists, with None where the cycle has no override. Thresholds are searched
+    within each cycle's window only, for all the cycles at once.
+    """
+    count = len(cycle_times_df)
+    positions = cycle_positions(cycle_times_df, cycles)
+    start_cuts, end_cuts, regression_start_cuts, regression_end_cuts = [
+        array([nan if cut is None else cut for cut in values], dtype=float)
+        for values in cuts]
+    start = cycle_times_df['Start'].to_numpy()
+    end = cycle_times_df['End'].to_numpy()
+    start_cuts = where(isnan(start_cuts), 0, start_cuts)
+    start_cut_times = minutes_after(start, start_cuts)
+
+    #First cut between the start cut and end of data to find regression points
+    rows, counts = window_rows(cycle_windows(cycle_index, lambda position: sorption_rows(
+        cycle_index, position), positions, start_cut_times, end))
+    groups = repeat(positions, counts)
+    times = cycle_index.times[rows]
+    yco2 = column_values(df, 'yCO2 [%]', rows)
+    regression_start_times = first_times(
+        groups, times, yco2 > params.regression_start, count)
+    regression_end_times = first_times(
+        groups, times, (yco2 > params.regression_end)
+        & (times > regression_start_times[groups]), count)
+    regression_start_minutes = total_seconds(regression_start_times - start) / 60
+    regression_end_minutes = total_seconds(regression_end_times - start) / 60
+
+    #Overrides win, NaN thresholds propagate like Python's min/max
+    end_cuts = where(isnan(end_cuts), regression_end_minutes, end_cuts)
+    latest = where(start_cuts > regression_start_minutes,
+                   start_cuts, regression_start_minutes)
+    regression_start_cuts = where(isnan(regression_start_cuts),
+        where(end_cuts < latest, end_cuts, latest), regression_start_cuts)
+    regression_end_cuts = where(isnan(regression_end_cuts),
+        where(end_cuts < regression_end_minutes, end_cuts, regression_end_minutes),
+        regression_end_cuts)
+
+    return pd.DataFrame(dict(zip(CUT_TIME_COLUMNS, [
+        start_cuts, end_cuts, regression_start_cuts, regression_end_cuts]))).iloc[positions]
+
+def sorption_metrics(df, cycle_times_df, cycle_index, cycles=None, absorbed=None):
+    """Absorbed CO2, lowest yCO2 and duration of each cycle's sorption window
+
+    absorbed is the run's absorbed_totals, built here when not given.
+    """
+    count = len(cycle_times_df)
+    positions = cycle_positions(cycle_times_df, cycles)
+    start = cycle_times_df['Start'].to_numpy()
+    start_cut_times = minutes_after(
+        start, cycle_times_df['Sorption Start Time'].to_numpy(dtype=float))
+    end_cut_times = minutes_after(
+        start, cycle_times_df['Sorption End Time'].to_numpy(dtype=float))
+
+    if absorbed is None:
+        absorbed = absorbed_totals(df, cycle_index)
+    windows = cycle_windows(cycle_index, lambda position: sorption_rows(
+        cycle_index, position), positions, start_cut_times, end_cut_times)
+    rows, counts = window_rows(windows)
+    groups = repeat(positions, counts)
+    total_absorbed = absorbed.window_sums(windows)
+    yco2 = column_values(df, 'yCO2 [%]', rows)
+    positive = yco2 > 0
+    min_gammas = pd.Series(yco2[positive]).groupby(groups[positive]).min()\
+        .reindex(arange(count)).to_numpy() / 100
+    duration_seconds = total_seconds(end_cut_times - start_cut_times)
+
+    sorption_durations = [
+        f"{int(ds // 3600)}:{int((ds % 3600) // 60):02d}:{int(ds % 60):02d}"\
+            if pd.notna(ds) else nan
+        for ds in duration_seconds[positions]
+    ]
+    return pd.DataFrame({
+        'Sorption Duration': sorption_durations,
+        'Highest Sorption Point': min_gammas[positions],
+        'Experimental CO2absorbed [mol]': total_absorbed,
+    }, index=positions)
+
+def capacity_metrics(absorbed_mol, params):
+    """Capacity of each cycle from its absorbed CO2 [mol]"""
+    capacity = pd.DataFrame(index=absorbed_mol.index)
+    capacity['Experimental CO2absorbed [g]'] = absorbed_mol * CO2_MOLAR_MASS
+    capacity['Sorbent Capacity [gCO2/gSorbent]']\
+          = capacity['Experimental CO2absorbed [g]'] / params.sorbent_mass
+    capacity['Sorbent Capacity [gCO2/mLReactor]']\
+          = capacity['Experimental CO2absorbed [g]'] / params.sorbent_volume
+    capacity['Capacity % to KPI']\
+          = capacity['Sorbent Capacity [gCO2/mLReactor]'] / 0.0283
+          # ABOVE CONSTANT PULLED FROM EXCEL, UNSURE OF ORIGIN
+    return capacity
+
+def kinetics_dry(highest_sorption_point, params):
+    """Rate Constant K of each cycle from the dry kinetics model"""
+    #Define constants
+    reactor_pressure = 101325 #pa
+    reactor_temp_c = 55
+    reactor_temp_k = reactor_temp_c + 273
+    gas_constant_r = 8.3145
+    rh_before_reaction = 100
+    h20_molar_mass = 18.02
+    inch_to_meter = 0.0254
+    sccm_to_molar = reactor_pressure * (1e-6) / (60) / gas_constant_r / 273.15
+
+    #Propagate calculations using program inputs
+    input_flow_rate_molar = params.input_flow_rate * sccm_to_molar
+    input_flow_rate_meter = input_flow_rate_molar * 8.3145 * reactor_temp_k\
+          / reactor_pressure
+    co2_flow_rate_sccm = params.input_flow_rate * params.reactor_input_ratio / 100
+    co2_flow_rate_molar = co2_flow_rate_sccm * sccm_to_molar
+    reactor_area = pi*((params.reactor_diameter * inch_to_meter / 2)**2)
+    packing_length_cm = params.sorbent_volume\
+          / (pi * (params.reactor_diameter * inch_to_meter * 50)**2)
+    packing_volume = reactor_area * packing_length_cm / 100
+    residence_time = packing_volume / input_flow_rate_meter
+    ah_before_reaction_gm3 = 6.112 * (e ** ((17.67*reactor_temp_c)\
+          /(reactor_temp_c+243.5))) * rh_before_reaction * h20_molar_mass \
+          / reactor_temp_k / 100 / 0.08314
+    ah_before_reaction = ah_before_reaction_gm3 / h20_molar_mass
+    co2_fraction_before = params.reactor_input_ratio / 100
+
+    #Below will be arrays if there are multiple cycles
+    co2_fraction_after = highest_sorption_point
+    co2_consumed = co2_flow_rate_molar * (co2_fraction_before - co2_fraction_after)\
+        / co2_fraction_before / input_flow_rate_meter
+    ah_after_reaction = ah_before_reaction - co2_consumed
+    co2_before_reaction = co2_flow_rate_molar / input_flow_rate_meter
+    co2_after_reaction = co2_before_reaction - co2_consumed
+    return (log(co2_after_reaction / ah_after_reaction)\
+         - log(co2_before_reaction / ah_before_reaction))\
+         / (ah_before_reaction - co2_before_reaction) / (-residence_time)
+
+def segment_regressions(x, y, counts):
+    """Slope and r of y against x for consecutive segments of counts rows
+
+    All segments are fitted at once from segmented sums, matching
+    scipy.stats.linregress on each: NaN below two rows, and identical marks
+    segments whose x values are all equal, where linregress raises.
+    """
+    slopes = full(len(counts), nan)
+    r_values = full(len(counts), nan)
+    identical = zeros(len(counts), dtype=bool)
+    fitted = counts > 1
+    if not fitted.any():
+        return slopes, r_values, identical
+    # reduceat needs increasing starts, so only fitted segments take part
+    rows = repeat(fitted, counts)
+    x, y, n = x[rows], y[rows], counts[fitted]
+    starts = r_[0, cumsum(n)[:-1]]
+    dx = x - repeat(add.reduceat(x, starts) / n, n)
+    dy = y - repeat(add.reduceat(y, starts) / n, n)
+    ssxm = add.reduceat(dx * dx, starts) / n
+    ssxym = add.reduceat(dx * dy, starts) / n
+    ssym = add.reduceat(dy * dy, starts) / n
+    with errstate(divide='ignore', invalid='ignore'):
+        slopes[fitted] = ssxym / ssxm
+        r_values[fitted] = where((ssxm == 0) | (ssym == 0), 0.0,
+                                 clip(ssxym / sqrt(ssxm * ssym), -1, 1))
+    identical[fitted] = maximum.reduceat(x, starts) == minimum.reduceat(x, starts)
+    return slopes, r_values, identical
+
+def kinetics_wet(df, cycle_times_df, cycle_index, params, cycles=None, absorbed=None):
+    """Wet kinetics columns and each cycle's Rate Constant K and regression R2
+
+    Returns the row positions the columns cover (None for every row of df),
+    the WET_COLUMNS values for those rows and the per-cycle metrics.
+    absorbed is the run's absorbed_totals, built here when not given.
+    """
+    count = len(cycle_times_df)
+    positions = cycle_positions(cycle_times_df, cycles)
+    start = cycle_times_df['Start'].to_numpy()
+    sorption_start = minutes_after(
+        start, cycle_times_df['Sorption Start Time'].to_numpy(dtype=float))
+    regression_start = minutes_after(
+        start, cycle_times_df['Regression Start Time'].to_numpy(dtype=float))
+    regression_end = minutes_after(
+        start, cycle_times_df['Regression End Time'].to_numpy(dtype=float))
+
+    #Masking from beginning of sorption to end of integration
+    if absorbed is None:
+        absorbed = absorbed_totals(df, cycle_index)
+    windows = cycle_windows(cycle_index, cycle_index.cycle_rows, positions,
+                            sorption_start, regression_end, inclusive=True)
+    inside, counts = window_rows(windows)
+    inside_groups = repeat(positions, counts)
+    absorbed_cumsum = absorbed.running(windows)
+    #Each cycle's active volume is scaled by its last accumulated value
+    last_absorbed = full(count, nan)
+    last_absorbed[positions[counts > 0]] = absorbed_cumsum[cumsum(counts)[counts > 0] - 1]
+    sorbent_active_volume = params.sorbent_volume - (absorbed_cumsum * CO2_MOLAR_MASS\
+        / (last_absorbed[inside_groups] * CO2_MOLAR_MASS / params.sorbent_volume))
+    residence_time = sorbent_active_volume / params.input_flow_rate * 60
+
+    #Buffers cover every row, or just the calculated cycles' rows
+    if cycles is None:
+        rows = None
+        buffer_rows = inside
+        length = len(df)
+    else:
+        rows = sort(concatenate([row_positions(cycle_index.cycle_rows(position))
+                                 for position in positions] or [array([], dtype=intp)]))
+        buffer_rows = searchsorted(rows, inside)
+        length = len(rows)
+    wet = {column: full(length, nan) for column in WET_COLUMNS}
+    wet['Accumulated CO2 Absorbed [mol]'][buffer_rows] = absorbed_cumsum
+    wet['Volume of Active Sorbent [mL]'][buffer_rows] = sorbent_active_volume
+    wet['Residence Time [s]'][buffer_rows] = residence_time
+
+    # Linear regression: ln[CO2] = -k*t + CONSTANT_LNCO2_0, within the regression region
+    fit, fit_counts = window_rows(cycle_windows(cycle_index, cycle_index.cycle_rows,
+                                  positions, regression_start, regression_end))
+    # Fit rows outside the integration window have no residence time
+    x = wet['Residence Time [s]'][fit if rows is None else searchsorted(rows, fit)]
+    y = column_values(df, 'ln[CO2]', fit) - CONSTANT_LNCO2_0
+    fit_counts_all = zeros(count, dtype=intp)
+    fit_counts_all[positions] = fit_counts
+    slopes, r_values, identical = segment_regressions(x, y, fit_counts_all)
+    # Where linregress would raise on identical x values the fit is zeroed
+    rate_constants = where(identical, 0, -slopes)
+    r2s = where(identical, 0, r_values ** 2)
+
+    metrics = pd.DataFrame({'Rate Constant K (Wet)': rate_constants[positions],
+                            'Wet Kinetics Regression R2': r2s[positions]},
+                           index=positions)
+    return rows, pd.DataFrame(wet), metrics
+
+class CycleSums:
+    """Prefix sums over one cycle's rows, giving its metrics for any cuts
+
+    Built once from a calculated cycle, e.g. while a cut is dragged. Window
+    bounds are two binary searches, and absorbed CO2 and the wet kinetics
+    regression sums are then lookups. Residence time is linear in the
+    absorbed running total T once the sorption start and regression end are
+    fixed, so the regression is fitted against T and rescaled. T and
+    ln[CO2] are centred on the cycle's means to keep the sums precise.
+    """
+    def __init__(self, df, cycle_times_df, cycle_index, position):
+        rows = row_positions(cycle_index.cycle_rows(position))
+        rows = rows[argsort(cycle_index.times[rows], kind='stable')]
+        self.start = cycle_times_df['Start'].to_numpy()[position]
+        self.times = cycle_index.times[rows]
+        absorbed = column_values(df, 'CO2 Absorbed [mol]', rows)
+        self.absorbed_missing = isnan(absorbed)
+        absorbed = where(self.absorbed_missing, 0, absorbed)
+        self.sorption = cycle_index.phase_values[rows] == 3 \
+            if cycle_index.has_identifier else ones(len(rows), dtype=bool)
+        self.sorption_absorbed = r_[0., cumsum(where(self.sorption, absorbed, 0))]
+        self.yco2 = column_values(df, 'yCO2 [%]', rows)
+        # Running total of absorbed CO2 through each row
+        self.totals = cumsum(absorbed)
+
+        y = column_values(df, 'ln[CO2]', rows) - CONSTANT_LNCO2_0
+        valid = isfinite(y) & ~self.absorbed_missing
+        t = where(valid, self.totals - (self.totals[valid].mean() if valid.any() else 0), 0)
+        y = where(valid, y - (y[valid].mean() if valid.any() else 0), 0)
+        self.invalid = r_[0, cumsum(~valid)]
+        self.t, self.tt, self.y, self.yy, self.ty = [
+            r_[0., cumsum(values)] for values in (t, t * t, y, y * y, t * y)]
+
+    def bounds(self, start_minutes, end_minutes, include=False):
+        """First row and stop of the rows between two cut times"""
+        start, end = minutes_after(self.start, array([start_minutes, end_minutes], dtype=float))
+        if isnat(start) or isnat(end):
+            return 0, 0
+        lo = searchsorted(self.times, start, 'left' if include else 'right')
+        hi = searchsorted(self.times, end, 'right' if include else 'left')
+        return lo, max(lo, hi)
+
+    def absorbed(self, start_minutes, end_minutes):
+        """Absorbed CO2 [mol] and lowest yCO2 of the sorption rows in a window"""
+        lo, hi = self.bounds(start_minutes, end_minutes)
+        yco2 = self.yco2[lo:hi][self.sorption[lo:hi]]
+        yco2 = yco2[yco2 > 0]
+        lowest = yco2.min() / 100 if len(yco2) else nan
+        return self.sorption_absorbed[hi] - self.sorption_absorbed[lo], lowest
+
+    def regression(self, lo, hi):
+        """Centred sums of the fit rows lo to hi: count, T, T², y, y², Ty"""
+        return (hi - lo, self.invalid[hi] - self.invalid[lo], self.t[hi] - self.t[lo],
+                self.tt[hi] - self.tt[lo], self.y[hi] - self.y[lo],
+                self.yy[hi] - self.yy[lo], self.ty[hi] - self.ty[lo])
+
+def regression_fit(n, invalid, t, tt, y, yy, ty):
+    """Slope of y against T, r and whether every T is identical, from sums
+
+    Works on scalars or arrays alike. NaN below two rows or with an invalid
+    row, as linregress gives.
+    """
+    with errstate(divide='ignore', invalid='ignore'):
+        ssxm = tt / n - (t / n) ** 2
+        ssym = yy / n - (y / n) ** 2
+        ssxym = ty / n - (t / n) * (y / n)
+        # Rounding can leave a constant column slightly off zero
+        identical = ssxm <= 1e-12 * maximum(tt / n, 1e-300)
+        slope = where((n > 1) & (invalid == 0), ssxym / ssxm, nan)
+        r = where((n > 1) & (invalid == 0), where(identical | (ssym <= 0), 0.0,
+                  clip(ssxym / sqrt(ssxm * ssym), -1, 1)), nan)
+    return slope, r, identical
+
+def cycle_metrics(sums, params, cut_minutes):
+    """Capacity, dry and wet kinetics of a cycle for given cut times
+
+    cut_minutes holds the four CUT_TIME_COLUMNS values, as resolved by
+    cut_times. Matches the calculated columns up to rounding.
+    """
+    sorption_start, sorption_end, regression_start, regression_end = cut_minutes
+    absorbed, lowest = sums.absorbed(sorption_start, sorption_end)
+    metrics = capacity_metrics(pd.Series([absorbed]), params).iloc[0].to_dict()
+    metrics['Experimental CO2absorbed [mol]'] = absorbed
+    metrics['Rate Constant K (Dry)'] = kinetics_dry(lowest, params)
+
+    inside_lo, inside_hi = sums.bounds(sorption_start, regression_end, include=True)
+    lo, hi = sums.bounds(regression_start, regression_end)
+    k = r2 = nan
+    if inside_hi > inside_lo:
+        # Accumulated absorbed at the end of the integration window scales the volume
+        last = nan if sums.absorbed_missing[inside_hi - 1] \
+            else sums.totals[inside_hi - 1] - (sums.totals[inside_lo - 1] if inside_lo else 0)
+        n, invalid, t, tt, y, yy, ty = sums.regression(lo, hi)
+        # Fit rows before the integration window have no residence time
+        invalid += max(0, min(hi, inside_lo) - lo)
+        slope, r, identical = regression_fit(n, invalid, t, tt, y, yy, ty)
+        # Residence time = a * (1 - T / last) up to a shift, a = volume / flow
+        scale = -params.sorbent_volume / params.input_flow_rate * 60 / last
+        k = 0.0 if identical and n > 1 and not invalid else -float(slope) / scale
+        r2 = 0.0 if identical and n > 1 and not invalid else float(r) ** 2
+    metrics['Rate Constant K (Wet)'] = k
+    metrics['Wet Kinetics Regression R2'] = r2
+    return metrics
+
+# Most candidate window boundaries tried per cycle by best_regression_windows
+OPTIMIZER_BOUNDARIES = 200
+
+def best_regression_window(sums, sorption_start, sorption_end, min_minutes, min_points,
+                           max_boundaries=OPTIMIZER_BOUNDARIES):
+    """Regression start and end cut minutes giving a cycle its highest wet R2
+
+    Every window of rows inside the sorption region is scored from the
+    CycleSums in O(1), as R2 doesn't depend on where the regression end puts
+    the residence time scale. Boundaries are thinned to max_boundaries
+    evenly spaced rows. Cuts fall halfway between rows, so the fit takes
+    exactly the window's rows. Returns NaNs when no window qualifies.
+    """
+    lo, hi = sums.bounds(sorption_start, sorption_end)
+    # Cuts need a row either side of the window
+    lo, hi = max(lo, 1), min(hi, len(sums.times) - 1)
+    if hi - lo < max(min_points, 2):
+        return nan, nan, nan
+    boundaries = unique(linspace(lo, hi, min(hi - lo + 1, max_boundaries))
+                        .round().astype(intp))
+    first, stop = boundaries[:, None], boundaries[None, :]
+    length = total_seconds(sums.times[maximum(stop - 1, 0)] - sums.times[first]) / 60
+    allowed = (stop - first >= min_points) & (length >= min_minutes)
+    n, invalid, t, tt, y, yy, ty = sums.regression(first, stop)
+    _, r, identical = regression_fit(n, invalid, t, tt, y, yy, ty)
+    r2 = where(identical, 0, r ** 2)
+    r2 = where(allowed & isfinite(r2), r2, -1)
+    best = r2.argmax()
+    if r2.flat[best] < 0:
+        return nan, nan, nan
+    first, stop = boundaries[best // len(boundaries)], boundaries[best % len(boundaries)]
+    minutes = total_seconds(sums.times - sums.start) / 60
+    return ((minutes[first - 1] + minutes[first]) / 2,
+            (minutes[stop - 1] + minutes[stop]) / 2, r2.flat[best])
+
+def best_regression_windows(df, cycle_times_df, cycle_index, min_minutes, min_points,
+                            cycles=None):
+    """best_regression_window of each cycle, within its calculated sorption cuts"""
+    positions = cycle_positions(cycle_times_df, cycles)
+    sorption_start = cycle_times_df['Sorption Start Time'].to_numpy(dtype=float)
+    sorption_end = cycle_times_df['Sorption End Time'].to_numpy(dtype=float)
+    windows = [best_regression_window(
+        CycleSums(df, cycle_times_df, cycle_index, position),
+        sorption_start[position], sorption_end[position], min_minutes, min_points)
+        for position in positions]
+    return pd.DataFrame(windows, index=positions, columns=[
+        'Regression Start Cut', 'Regression End Cut', 'Wet Kinetics Regression R2'])
+
+def calculate_secondary(df, params, start_row=0):
+    """Write the secondary columns into df, from start_row onwards"""
+    _, co2_ref_col = reference_column(df, params.ref_gas)
+    #Live mode only appends rows, so earlier rows are already up to date
+    columns = ['TimeDiff', co2_ref_col, 'yCO2 [%]', '[CO2]', 'ln[CO2]',
+        'CO2 Partial Flow Rate Out [mol/s]', 'CO2 Absorbed [mol]']
+    if not all(col in df.columns for col in columns):
+        start_row = 0
+    secondary = secondary_columns(df, params, start_row)
+    for col in columns:
+        if start_row == 0:
+            df[col] = secondary[col].to_numpy()
+        else:
+            df.iloc[start_row:, df.columns.get_loc(col)] = \
+                secondary[col].to_numpy()
+
+def calculate_cut_times(df, cycle_times_df, cycle_index, params, cuts, cycles=None):
+    """Write the four cut times of each cycle into cycle_times_df"""
+    set_cycle_values(cycle_times_df,
+                     cut_times(df, cycle_times_df, cycle_index, params, cuts, cycles))
+
+def calculate_sorption(df, cycle_times_df, cycle_index, cycles=None, absorbed=None):
+    """Write sorption window metrics into cycle_times_df"""
+    set_cycle_values(cycle_times_df, sorption_metrics(
+        df, cycle_times_df, cycle_index, cycles, absorbed))
+
+def calculate_capacity(cycle_times_df, params, cycles=None):
+    """Write capacity metrics into cycle_times_df"""
+    positions = cycle_positions(cycle_times_df, cycles)
+    set_cycle_values(cycle_times_df, capacity_metrics(
+        cycle_times_df['Experimental CO2absorbed [mol]'].iloc[positions], params))
+
+def calculate_kinetics_dry(cycle_times_df, params, cycles=None):
+    """Write the dry kinetics Rate Constant K into cycle_times_df"""
+    positions = cycle_positions(cycle_times_df, cycles)
+    set_cycle_values(cycle_times_df, pd.DataFrame({'Rate Constant K (Dry)': kinetics_dry(
+        cycle_times_df['Highest Sorption Point'].iloc[positions], params)}))
+
+def calculate_kinetics_wet(df, cycle_times_df, cycle_index, params, cycles=None,
+                           absorbed=None):
+    """Write the wet kinetics columns into df and its metrics into cycle_times_df"""
+    rows, wet, metrics = kinetics_wet(df, cycle_times_df, cycle_index, params, cycles,
+                                      absorbed)
+    for col in WET_COLUMNS:
+        if rows is None:
+            df[col] = wet[col].to_numpy()
+        else:
+            if col not in df.columns:
+                df[col] = nan
+            df.iloc[rows, df.columns.get_loc(col)] = wet[col].to_numpy()
+    set_cycle_values(cycle_times_df, metrics)
+
+# Calculation stages in the order they run, each with the stages reading its results
+STAGE_DEPENDENTS = {
+    'secondary': ['cut_times', 'sorption', 'wet'],
+    'cut_times': ['sorption', 'wet'],
+    'sorption': ['capacity', 'dry'],
+    'capacity': [],
+    'dry': [],
+    'wet': [],
+}
+# Stages reading each run parameter directly (Packing Factor isn't used yet)
+PARAMETER_STAGES = {
+    'sorbent_mass': ['capacity', 'dry', 'wet'],
+    'reactor_diameter': ['dry'],
+    'bulk_density': ['capacity', 'dry', 'wet'],
+    'input_flow_rate': ['secondary', 'dry', 'wet'],
+    'packing_factor': [],
+    'reactor_input_ratio': ['secondary', 'dry'],
+    'qms_input_ratio': ['secondary'],
+    'regression_start': ['cut_times'],
+    'regression_end': ['cut_times'],
+    'ref_gas': ['secondary'],
+}
+
+# Run parameters the secondary columns depend on
+SECONDARY_FIELDS = [field for field, stages in PARAMETER_STAGES.items()
+                    if 'secondary' in stages]
+# Secondary column sets kept per run, e.g. to flip between reference gases
+SECONDARY_CACHE_SIZE = 4
+
+class SecondaryCache:
+    """Least recently used secondary column sets of one run
+
+    Keyed by the row count and SECONDARY_FIELDS, so going back to an earlier
+    reference gas or input ratio reuses its columns instead of recalculating.
+    """
+    def __init__(self, size=SECONDARY_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def key(self, df, params):
+        return (len(df),) + tuple(getattr(params, field) for field in SECONDARY_FIELDS)
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, secondary):
+        self.entries[key] = secondary
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def copy(self):
+        cache = SecondaryCache(self.size)
+        cache.entries = OrderedDict(self.entries)
+        return cache
+
+class CalculationCancelled(Exception):
+    """Raised between stages once a newer calculation supersedes this one"""
+
+def mark_stale(stale, stage, positions):
+    """Add cycle positions (None for every cycle) to a stage's stale cycles"""
+    if positions is None or stale.get(stage, ()) is None:
+        stale[stage] = None
+    else:
+        stale[stage] = stale.get(stage, set()) | set(positions)
+
+class RunCalculator:
+    """Keeps a run's derived columns and cycle metrics in step with its inputs
+
+    update() compares the run parameters and per-cycle cuts with those of the
+    last calculation, then reruns only the stages, and the cycles, that depend
+    on what changed. Moving one cycle's cut recalculates that cycle alone.
+    fork() gives a calculator to run off the GUI thread, adopted when done.
+    """
+    def __init__(self, df, cycle_times_df, cycle_index):
+        self.df = df
+        self.cycle_times_df = cycle_times_df
+        self.cycle_index = cycle_index
+        self.params = None
+        self.cuts = None
+        self.secondary_cache = SecondaryCache()
+        # RunningTotals of CO2 Absorbed [mol], built when first needed
+        self.absorbed = None
+        # Stages the last calculation ran, with their cycle positions (None for all)
+        self.recalculated = {}
+
+    def is_for(self, df, cycle_times_df, cycle_index):
+        """Whether the calculator still works on these frames"""
+        return self.df is df and self.cycle_times_df is cycle_times_df \
+            and self.cycle_index is cycle_index
+
+    def fork(self):
+        """Calculator over copies of the frames, which it can change freely
+
+        Columns are shared until the fork replaces them. The wet kinetics
+        columns are written per cycle in place, so those are copied up front.
+        """
+        df = self.df.copy(deep=False)
+        for col in WET_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].to_numpy(copy=True)
+        fork = RunCalculator(df, self.cycle_times_df.copy(), self.cycle_index)
+        fork.params = self.params
+        fork.cuts = self.cuts
+        fork.secondary_cache = self.secondary_cache.copy()
+        fork.absorbed = self.absorbed
+        return fork
+
+    def update(self, params, cuts, cancelled=None, progress=None):
+        """Recalculate whatever depends on changed parameters or cuts
+
+        cancelled() is checked before each stage, and progress(done, total)
+        called after it.
+        """
+        stale = {}
+        if self.params is None:
+            mark_stale(stale, 'secondary', None)
+        else:
+            for field, value, previous in zip(params._fields, params, self.params):
+                if value != previous:
+                    for stage in PARAMETER_STAGES[field]:
+                        mark_stale(stale, stage, None)
+            if any(len(values) != len(previous)
+                   for values, previous in zip(cuts, self.cuts)):
+                mark_stale(stale, 'cut_times', None)
+            else:
+                moved = [position for position, (cycle_cuts, previous_cuts)
+                         in enumerate(zip(zip(*cuts), zip(*self.cuts)))
+                         if cycle_cuts != previous_cuts]
+                if moved:
+                    mark_stale(stale, 'cut_times', moved)
+        self.params = params
+        self.cuts = [list(values) for values in cuts]
+        self.run(stale, cancelled, progress)
+
+    def append(self, df, cycle_times_df, cycle_index, first_row, cycles):
+        """Calculate rows appended in live mode and the cycles they touch"""
+        self.df = df
+        self.cycle_times_df = cycle_times_df
+        self.cycle_index = cycle_index
+        # New cycles start out without cuts
+        self.cuts = [values + [None] * (len(cycle_times_df) - len(values))
+                     for values in self.cuts]
+        # Cached column sets no longer cover every row
+        self.secondary_cache.clear()
+        calculate_secondary(df, self.params, first_row)
+        self.absorbed = None
+        stale = {}
+        mark_stale(stale, 'cut_times', cycle_positions(cycle_times_df, cycles))
+        self.run(stale)
+
+    def run(self, stale, cancelled=None, progress=None):
+        stages = []
+        for stage, dependents in STAGE_DEPENDENTS.items():
+            if stage not in stale or stale[stage] == set():
+                continue
+            for dependent in dependents:
+                mark_stale(stale, dependent, stale[stage])
+            stages.append(stage)
+        self.recalculated = {stage: stale[stage] for stage in stages}
+        for done, stage in enumerate(stages):
+            if cancelled is not None and cancelled():
+                raise CalculationCancelled()
+            self.calculate(stage, stale[stage])
+            if progress is not None:
+                progress(done + 1, len(stages))
+
+    def absorbed_totals(self):
+        if self.absorbed is None:
+            self.absorbed = absorbed_totals(self.df, self.cycle_index)
+        return self.absorbed
+
+    def calculate(self, stage, positions):
+        df, cycle_times_df, cycle_index = self.df, self.cycle_times_df, self.cycle_index
+        params = self.params
+        cycles = None if positions is None \
+            else cycle_times_df['Cycle'].iloc[sorted(positions)].tolist()
+        if stage == 'secondary':
+            key = self.secondary_cache.key(df, params)
+            secondary = self.secondary_cache.get(key)
+            if secondary is None:
+                secondary = secondary_columns(df, params)
+                self.secondary_cache.put(key, secondary)
+            # Copied, so later writes into df can't alter the cached set
+            for col in secondary.columns:
+                df[col] = secondary[col].to_numpy(copy=True)
+            self.absorbed = None
+        elif stage == 'cut_times':
+            calculate_cut_times(df, cycle_times_df, cycle_index, params, self.cuts, cycles)
+        elif stage == 'sorption':
+            calculate_sorption(df, cycle_times_df, cycle_index, cycles,
+                               self.absorbed_totals())
+        elif stage == 'capacity':
+            calculate_capacity(cycle_times_df, params, cycles)
+        elif stage == 'dry':
+            calculate_kinetics_dry(cycle_times_df, params, cycles)
+        elif stage == 'wet':
+            calculate_kinetics_wet(df, cycle_times_df, cycle_index, params, cycles,
+                                   self.absorbed_totals())
+
+def analyze_run(df, cycle_times_df, cycle_index, params, cuts):
+    """Run every calculation the Cycle Analysis tab does, in the same order"""
+    RunCalculator(df, cycle_times_df, cycle_index).update(params, cuts)
@@ -0,0 +1,117 @@
+from typing import NamedTuple
+import pandas as pd
+from numpy import count_nonzero, fmax, fmin, floor, isnan, log10, nan
+from CapacityEngine import WET_COLUMNS
+
+class ColumnStats(NamedTuple):
+    """Summary of some values of a column, max/min/absmax NaN if none are set"""
+    maximum: float
+    minimum: float
+    absmax: float
+    nans: int
+    count: int
+
+    @classmethod
+    def of(cls, values):
+        """ColumnStats of a float array"""
+        missing = isnan(values)
+        nans = int(count_nonzero(missing))
+        if nans == len(values):
+            return cls(nan, nan, nan, nans, len(values))
+        values = values[~missing]
+        maximum, minimum = float(values.max()), float(values.min())
+        return cls(maximum, minimum, max(abs(maximum), abs(minimum)), nans, len(values) + nans)
+
+    def combine(self, other):
+        """ColumnStats of the values of both"""
+        return ColumnStats(float(fmax(self.maximum, other.maximum)),
+                           float(fmin(self.minimum, other.minimum)),
+                           float(fmax(self.absmax, other.absmax)),
+                           self.nans + other.nans, self.count + other.count)
+
+    def scaling_factor(self):
+        """Power of ten of the maximum, which the graphs divide a column by"""
+        if isnan(self.maximum) or self.maximum == 0:
+            return 1
+        return 10**floor(log10(abs(self.maximum)))
+
+class ColumnStatistics:
+    """ColumnStats of mdf's numeric columns, over the whole run and cycle windows
+
+    Each is computed when first asked for and kept until its column changes.
+    adopt() moves to a calculation's frame, dropping the columns it rewrote,
+    and append() folds rows appended in live mode into the run-wide stats.
+    """
+    def __init__(self, df):
+        self.frame = df
+        # Run-wide stats by column, and (window, stats) by column and cycle position
+        self.run = {}
+        self.cycles = {}
+
+    def values(self, label, rows=slice(None)):
+        """Float values of a numeric column at rows, None for other columns"""
+        column = self.frame[label]
+        if not pd.api.types.is_numeric_dtype(column) or pd.api.types.is_bool_dtype(column):
+            return None
+        return column.iloc[rows].to_numpy(dtype=float, na_value=nan)
+
+    def column(self, label):
+        """ColumnStats of a whole column, None unless it's numeric"""
+        if label not in self.frame.columns:
+            return None
+        if label not in self.run:
+            values = self.values(label)
+            self.run[label] = None if values is None else ColumnStats.of(values)
+        return self.run[label]
+
+    def cycle(self, label, position, rows):
+        """ColumnStats of a column over rows of one cycle, None unless it's numeric
+
+        One window is kept per cycle, so moving a cut recalculates it.
+        """
+        if label not in self.frame.columns:
+            return None
+        key = (rows.start, rows.stop) if isinstance(rows, slice) else rows.tobytes()
+        cached = self.cycles.get((label, position))
+        if cached is None or cached[0] != key:
+            values = self.values(label, rows)
+            cached = (key, None if values is None else ColumnStats.of(values))
+            self.cycles[(label, position)] = cached
+        return cached[1]
+
+    def invalidate(self, columns=None, positions=None):
+        """Forget stats of columns (None for all), run-wide and for cycle positions
+
+        positions None forgets every cycle's stats of the columns.
+        """
+        for label in list(self.run):
+            if columns is None or label in columns:
+                del self.run[label]
+        for label, position in list(self.cycles):
+            if (columns is None or label in columns) \
+                    and (positions is None or position in positions):
+                del self.cycles[(label, position)]
+
+    def forget_recalculated(self, recalculated):
+        """Forget the columns a RunCalculator's last run rewrote"""
+        if 'secondary' in recalculated:
+            self.invalidate()
+        elif 'wet' in recalculated:
+            self.invalidate(WET_COLUMNS, recalculated['wet'])
+
+    def adopt(self, df, recalculated):
+        """Move to df, a calculation's copy of the frame"""
+        self.forget_recalculated(recalculated)
+        self.frame = df
+
+    def append(self, df, first_row, recalculated):
+        """Move to df, the frame with live rows appended from first_row on"""
+        self.forget_recalculated(recalculated)
+        self.frame = df
+        for label, stats in list(self.run.items()):
+            values = self.values(label, slice(first_row, None)) \
+                if label in df.columns else None
+            if stats is None or values is None:
+                del self.run[label]
+            else:
+                self.run[label] = stats.combine(ColumnStats.of(values))
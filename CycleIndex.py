@@ -0,0 +1,151 @@
+import pandas as pd
+from numpy import arange, array, asarray, clip, flatnonzero, intp, isnan, isnat, nan, r_, \
+    searchsorted, ones, where
+
+def row_positions(rows):
+    """Integer positions of a cycle_rows/phase_rows result"""
+    if isinstance(rows, slice):
+        return arange(rows.start, rows.stop)
+    return rows
+
+class CycleIndex:
+    """Row positions of every cycle, and of its Cycle Identifier phases, in mdf
+
+    Built once per load from run-length boundaries of 'No Completed Cycles'
+    and 'Cycle Identifier'. Cycles are kept in order of first appearance, so
+    position i matches row i of cycle_times_df. A cycle (or phase) whose rows
+    are contiguous is returned as a slice, giving zero-copy iloc views.
+    window() narrows either to a time range by binary search on the index,
+    and windows() does so for many cycles in one search.
+    """
+    def __init__(self, df):
+        self.length = len(df)
+        self.has_identifier = 'Cycle Identifier' in df.columns
+        self.times = df.index.to_numpy()
+        self.sorted = df.index.is_monotonic_increasing
+        if 'No Completed Cycles' not in df.columns:
+            # Mass spec only: a single cycle spanning the whole run
+            self.cycle_numbers = [1]
+            self.cycles = [(0, self.length, True)]
+            self.phases = {}
+            return
+
+        cycle_values = df['No Completed Cycles'].to_numpy(dtype=float, na_value=nan)
+        if self.has_identifier:
+            phase_values = df['Cycle Identifier'].to_numpy(dtype=float, na_value=nan)
+        else:
+            phase_values = cycle_values * nan
+
+        # Runs of rows sharing a cycle number and phase (NaN rows are runs of one)
+        changes = (cycle_values[1:] != cycle_values[:-1]) \
+            | (phase_values[1:] != phase_values[:-1])
+        starts = r_[0, flatnonzero(changes) + 1] if self.length else arange(0)
+        runs = pd.DataFrame({
+            'cycle': cycle_values[starts],
+            'phase': phase_values[starts],
+            'start': starts,
+            'stop': r_[starts[1:], self.length],
+        })
+        runs = runs[~isnan(runs['cycle'])]
+        runs['rows'] = runs['stop'] - runs['start']
+
+        cycle_spans = runs.groupby('cycle', sort=False).agg(
+            start=('start', 'min'), stop=('stop', 'max'), rows=('rows', 'sum'))
+        # Keep the original dtype of the cycle numbers (usually int64)
+        self.cycle_numbers = df['No Completed Cycles'].iloc[
+            cycle_spans['start'].to_numpy()].tolist()
+        self.cycles = [(start, stop, stop - start == rows) for start, stop, rows
+                       in cycle_spans.itertuples(index=False)]
+
+        phase_spans = runs[~isnan(runs['phase'])].groupby(
+            ['cycle', 'phase'], sort=False).agg(
+            start=('start', 'min'), stop=('stop', 'max'), rows=('rows', 'sum'))
+        position = {cycle: i for i, cycle in enumerate(cycle_spans.index)}
+        self.phases = {(position[cycle], phase): (start, stop, stop - start == rows)
+                       for (cycle, phase), (start, stop, rows)
+                       in zip(phase_spans.index, phase_spans.itertuples(index=False))}
+        self.cycle_values = cycle_values
+        self.phase_values = phase_values
+
+    def __len__(self):
+        return len(self.cycles)
+
+    def cycle_rows(self, position):
+        """Row positions of a cycle, a slice unless other rows interleave it"""
+        start, stop, contiguous = self.cycles[position]
+        if contiguous:
+            return slice(start, stop)
+        cycle_number = self.cycle_numbers[position]
+        return start + flatnonzero(self.cycle_values[start:stop] == cycle_number)
+
+    def phase_rows(self, position, phase):
+        """Row positions of one Cycle Identifier phase within a cycle"""
+        if not self.phases:
+            return self.cycle_rows(position)
+        if (position, phase) not in self.phases:
+            return slice(0, 0)
+        start, stop, contiguous = self.phases[(position, phase)]
+        if contiguous:
+            return slice(start, stop)
+        cycle_number = self.cycle_numbers[position]
+        return start + flatnonzero(
+            (self.cycle_values[start:stop] == cycle_number)
+            & (self.phase_values[start:stop] == phase))
+
+    def window(self, rows, start=None, end=None, include_start=False,
+               include_end=False):
+        """Part of a cycle_rows/phase_rows result with times between start and end
+
+        Bounds are exclusive unless included, None leaves that side open and
+        NaT gives an empty window, as comparing against NaT would.
+        """
+        bounds = [None if bound is None else pd.Timestamp(bound).to_datetime64()
+                  for bound in (start, end)]
+        if any(bound is not None and isnat(bound) for bound in bounds):
+            return slice(0, 0)
+        start, end = bounds
+        times = self.times[rows]
+        if not self.sorted:
+            # Unsorted times can't be searched, fall back to a mask
+            inside = ones(len(times), dtype=bool)
+            if start is not None:
+                inside &= times >= start if include_start else times > start
+            if end is not None:
+                inside &= times <= end if include_end else times < end
+            return row_positions(rows)[inside]
+        lo = 0 if start is None else \
+            searchsorted(times, start, 'left' if include_start else 'right')
+        hi = len(times) if end is None else \
+            searchsorted(times, end, 'right' if include_end else 'left')
+        hi = max(lo, hi)
+        if isinstance(rows, slice):
+            return slice(rows.start + lo, rows.start + hi)
+        return rows[lo:hi]
+
+    def windows(self, rows, starts, ends, include_start=False, include_end=False):
+        """window() of each of a list of rows, with its own start and end
+
+        Contiguous rows of a sorted index are all narrowed by one binary
+        search of the whole index per bound.
+        """
+        if not self.sorted or not all(isinstance(part, slice) for part in rows):
+            return [self.window(part, start, end, include_start, include_end)
+                    for part, start, end in zip(rows, starts, ends)]
+        starts = asarray(starts, dtype=self.times.dtype)
+        ends = asarray(ends, dtype=self.times.dtype)
+        first = array([part.start for part in rows], dtype=intp)
+        last = array([part.stop for part in rows], dtype=intp)
+        lo = clip(searchsorted(self.times, starts,
+                               'left' if include_start else 'right'), first, last)
+        hi = clip(searchsorted(self.times, ends,
+                               'right' if include_end else 'left'), lo, last)
+        hi = where(isnat(starts) | isnat(ends), lo, hi)
+        return [slice(start, stop) for start, stop in zip(lo.tolist(), hi.tolist())]
+
+    def cycle_times(self, index):
+        """Start and end time of every cycle, the base of cycle_times_df"""
+        return pd.DataFrame({
+            'Cycle': self.cycle_numbers,
+            'Start': [index[start] for start, _, _ in self.cycles],
+            'End': [index[stop - 1] for _, stop, _ in self.cycles],
+        })
@@ -0,0 +1,169 @@
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QListWidget, QListWidgetItem
+from PyQt5.QtGui import QImage, QPixmap, QIcon
+from PyQt5.QtCore import Qt, QSize, QThread, pyqtSignal
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from numpy import array_equal
+import threading
+import CapacityEngine
+
+# Thumbnail size in pixels
+THUMBNAIL_WIDTH = 180
+THUMBNAIL_HEIGHT = 110
+
+def same_values(cached, values):
+    """Whether a cached array holds the same values, checked by identity first"""
+    return cached is values or (cached.shape == values.shape
+                                and array_equal(cached, values, equal_nan=True))
+
+def render_thumbnail(minutes, yco2, cut_times):
+    """QImage of a cycle's yCO2 curve with its cut markers, drawn with Agg
+
+    Uses its own Figure and canvas and draws no text, so it can run off the
+    GUI thread.
+    """
+    figure = Figure(figsize=(THUMBNAIL_WIDTH / 100, THUMBNAIL_HEIGHT / 100), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_axes([0, 0, 1, 1])
+    ax.plot(minutes, yco2, color='tab:blue', linewidth=0.8)
+    sorption_start, sorption_end, regression_start, regression_end = cut_times
+    # Markers drawn as on the Cycle Graph: sorption solid, regression dashed
+    ax.axvline(sorption_start, color='black', linewidth=0.8)
+    if sorption_end:
+        ax.axvline(sorption_end, color='black', linewidth=0.8)
+    for cut in (regression_start, regression_end):
+        if cut:
+            ax.axvline(cut, color='tab:red', linewidth=0.8, linestyle='--')
+    ax.set_xticks([])
+    ax.set_yticks([])
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    return QImage(canvas.buffer_rgba(), width, height, QImage.Format_RGBA8888).copy()
+
+class ThumbnailWorker(QThread):
+    """Renders (position, key, minutes, yco2, cut_times) jobs off the GUI thread"""
+    rendered = pyqtSignal(int, object, object)
+
+    def __init__(self, jobs):
+        super().__init__()
+        self.jobs = jobs
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        for position, key, minutes, yco2, cut_times in self.jobs:
+            if self.cancelled.is_set():
+                return
+            self.rendered.emit(position, key, render_thumbnail(minutes, yco2, cut_times))
+
+class CycleOverview(QWidget):
+    """Thumbnails of every cycle's yCO2 curve, clicked to open it on the Cycle Graph
+
+    Each thumbnail is cached with the minutes, yCO2 values and cut times it
+    was drawn from, and only redrawn once one of them changes.
+    """
+    def __init__(self, analysis):
+        super().__init__()
+        self.analysis = analysis
+        # (minutes, yco2, cut times bytes, QImage) by cycle position
+        self.thumbnails = {}
+        self.worker = None
+        self.workers = []
+
+        layout = QVBoxLayout(self)
+        self.overview_status = QLabel("Status: No cycles calculated")
+        layout.addWidget(self.overview_status)
+        self.cycle_list = QListWidget()
+        self.cycle_list.setViewMode(QListWidget.IconMode)
+        self.cycle_list.setIconSize(QSize(THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT))
+        self.cycle_list.setResizeMode(QListWidget.Adjust)
+        self.cycle_list.setMovement(QListWidget.Static)
+        self.cycle_list.setUniformItemSizes(True)
+        self.cycle_list.setSpacing(4)
+        layout.addWidget(self.cycle_list)
+        self.cycle_list.itemClicked.connect(self.open_cycle)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+
+    def refresh(self):
+        """Redraw, off the GUI thread, the thumbnails whose cycle has changed"""
+        cycle_instance = self.analysis.cycle_instance
+        if not self.isVisible() or cycle_instance.calculating():
+            return
+        df, cycle_times_df = cycle_instance.df, cycle_instance.cycle_times_df
+        if 'yCO2 [%]' not in df.columns or 'Sorption Start Time' not in cycle_times_df:
+            self.overview_status.setText("Status: No cycles calculated")
+            return
+        if self.cycle_list.count() != len(cycle_times_df):
+            self.cycle_list.clear()
+            blank = QPixmap(THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT)
+            blank.fill(Qt.white)
+            for cycle in cycle_times_df['Cycle']:
+                self.cycle_list.addItem(QListWidgetItem(QIcon(blank), f"Cycle {cycle}"))
+            for position, (_, _, _, image) in self.thumbnails.items():
+                self.show_thumbnail(position, image)
+
+        cut_times = cycle_times_df[CapacityEngine.CUT_TIME_COLUMNS].to_numpy(dtype=float)
+        jobs = []
+        for position in range(len(cycle_times_df)):
+            view = cycle_instance.cycle_view(position)
+            yco2 = view.column(df, 'yCO2 [%]')
+            key = (view.minutes, yco2, cut_times[position].tobytes())
+            cached = self.thumbnails.get(position)
+            if cached is None or cached[2] != key[2] or not same_values(cached[0], key[0]) \
+                    or not same_values(cached[1], yco2):
+                jobs.append((position, key, view.minutes, yco2, cut_times[position]))
+            elif cached[1] is not yco2:
+                # Same values in a new array, matched by identity next time
+                self.thumbnails[position] = key + cached[3:]
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+        if not jobs:
+            self.overview_status.setText(f"Status: {len(cycle_times_df)} cycles")
+            return
+        self.overview_status.setText(
+            f"Status: {len(cycle_times_df)} cycles, redrawing {len(jobs)}")
+        self.worker = ThumbnailWorker(jobs)
+        self.worker.rendered.connect(self.thumbnail_rendered)
+        self.worker.finished.connect(self.remove_worker)
+        self.workers.append(self.worker)
+        self.worker.start()
+
+    def thumbnail_rendered(self, position, key, image):
+        if self.sender() is not self.worker:
+            return
+        self.thumbnails[position] = key + (image,)
+        self.show_thumbnail(position, image)
+
+    def show_thumbnail(self, position, image):
+        if position < self.cycle_list.count():
+            self.cycle_list.item(position).setIcon(QIcon(QPixmap.fromImage(image)))
+
+    def remove_worker(self):
+        #finished arrives just before the thread exits, so wait for it first
+        worker = self.sender()
+        worker.wait()
+        self.workers.remove(worker)
+        if worker is self.worker:
+            self.worker = None
+            self.overview_status.setText(f"Status: {self.cycle_list.count()} cycles")
+
+    def open_cycle(self, item):
+        """Show the clicked cycle on the Cycle Graph"""
+        cycle_instance = self.analysis.cycle_instance
+        position = self.cycle_list.row(item)
+        #Keep the limits of the cycle being left, as the arrow buttons do
+        cycle_instance.xlim[cycle_instance.current_cycle_index] = \
+            tuple(float(x) for x in cycle_instance.ax1.get_xlim())
+        cycle_instance.ylim[cycle_instance.current_cycle_index] = \
+            tuple(float(y) for y in cycle_instance.ax1.get_ylim())
+        cycle_instance.current_cycle_index = position
+        cycle_instance.cycle_label.setText(
+            f'{cycle_instance.cycle_numbers[position]}/{max(cycle_instance.cycle_numbers)}')
+        cycle_instance.update_plots()
+        self.analysis.tabs.setCurrentWidget(cycle_instance)
@@ -6,8 +6,8 @@ from PyQt5.QtCore import Qt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas, NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
 import ast
-from numpy import number, floor, log10
 import pandas as pd
+from LevelOfDetail import MinMaxPyramid
 
 class DataViewer(QMainWindow):
     def __init__(self, analysis):
@@ -15,6 +15,11 @@ class DataViewer(QMainWindow):
         self.analysis = analysis
         self.xlim = None
         self.ylim = None
+        # Min/max pyramids per column of the frame they were built from
+        self.pyramids = {}
+        self.pyramid_frame = None
+        # One persistent line per plotted column: [line, pyramid, factor]
+        self.lines = {}
 
         self.setWindowTitle("Graph Run")
         screen_geometry = QApplication.desktop().screenGeometry()
@@ -36,6 +41,17 @@ class DataViewer(QMainWindow):
         home_action = self.toolbar.actions()[0]
         home_action.triggered.disconnect()
         home_action.triggered.connect(self.on_home_clicked)
+        self.canvas.mpl_connect('resize_event', lambda event: self.redecimate())
+
+        # The axes are kept across updates, only their lines change
+        self.ax = self.figure.add_subplot(111)
+        self.ax.set_facecolor("white")
+        self.figure.set_facecolor("white")
+        self.ax.set_xlabel("Elapsed Time (min)")
+        self.ax.set_ylabel("Concentration")
+        self.ax.grid(True, color="gray", linestyle="--")
+        # Zoom, pan and home redraw the lines at the new x-range's detail
+        self.ax.callbacks.connect('xlim_changed', self.redecimate)
 
         plot_panel.addWidget(self.toolbar)
         plot_panel.addWidget(self.canvas)
@@ -71,13 +87,14 @@ class DataViewer(QMainWindow):
         self.reactor_param_list.itemSelectionChanged.connect(self.update_plot)
 
     def calculate_scaling_factors(self):
-        # Only describe numeric columns
-        describe_df = self.analysis.mdf.select_dtypes(include=[number]).describe()
-        describe_df = describe_df.drop(columns=["TimeDiff"], errors="ignore")
-        scaling = (describe_df.loc['max']).apply(
-            lambda x: 10**(floor(log10(abs(x)))) if x != 0 else 1
-        ).fillna(1)
-        return scaling.to_dict()
+        # Only numeric columns, from the run's column statistics
+        column_stats = self.analysis.column_statistics()
+        scaling = {}
+        for col in self.analysis.mdf.columns.drop("TimeDiff", errors="ignore"):
+            stats = column_stats.column(col)
+            if stats is not None:
+                scaling[col] = stats.scaling_factor()
+        return scaling
 
     def get_selected_items(self, widget):
         return [item.text() for item in widget.selectedItems() if item.text() != "None"]
@@ -131,6 +148,9 @@ class DataViewer(QMainWindow):
         self.analysis.state_qlist['Selected Compounds'] = selected_compounds
         self.analysis.state_qlist['Selected Parameters'] = selected_reactor
         self.analysis.state_other['Scale Run Graph'] = self.scaling_checkbox.isChecked()
+        # Nothing plotted yet, or limits pulled from the state still to be applied
+        if not self.lines or self.xlim is not None:
+            return
         try:
             self.analysis.state_other['Run Graph Xlim'] = \
                 tuple(float(x) for x in self.ax.get_xlim())
@@ -139,50 +159,72 @@ class DataViewer(QMainWindow):
         except Exception as e:
             print(f"Error saving graph limits: {e}")
 
+    def pyramid(self, entry):
+        """MinMaxPyramid of a column of mdf against elapsed minutes"""
+        mdf = self.analysis.mdf
+        if self.pyramid_frame is not mdf:
+            # New rows or recalculated columns, start over
+            self.pyramids = {}
+            self.pyramid_frame = mdf
+            self.elapsed_minutes = ((mdf.index - mdf.index[0]).total_seconds() / 60).to_numpy()
+        if entry not in self.pyramids:
+            self.pyramids[entry] = MinMaxPyramid(
+                self.elapsed_minutes, mdf[entry].to_numpy(dtype=float, na_value=float('nan')))
+        return self.pyramids[entry]
+
+    def redecimate(self, ax=None):
+        """Redraw each shown line from its pyramid for the visible x-range"""
+        xmin, xmax = self.ax.get_xlim()
+        pixels = max(int(self.ax.bbox.width), 1)
+        for line, pyramid, factor in self.lines.values():
+            if line.get_visible():
+                x, y = pyramid.decimate(xmin, xmax, pixels)
+                line.set_data(x, y / factor)
+
     def update_plot(self):
-        if hasattr(self, 'ax'):
-            temp_xlim = self.ax.get_xlim()
+        """Show, hide and rescale the persistent lines to match the selections"""
+        had_lines = any(line.get_visible() for line, _, _ in self.lines.values())
+        limits = (self.ax.get_xlim(), self.ax.get_ylim())
         self.push_state()
-        self.figure.clear()
-        self.ax = self.figure.add_subplot(111)
         use_scaling = self.scaling_checkbox.isChecked()
+        pixels = max(int(self.ax.bbox.width), 1)
 
         selected_compounds = self.get_selected_items(self.compound_list)
         selected_reactor = self.get_selected_items(self.reactor_param_list)
-        all_selected = selected_compounds + selected_reactor
+        all_selected = [entry for entry in selected_compounds + selected_reactor
+                        if entry in self.analysis.mdf.columns]
 
-        for entry in all_selected:
-            if entry in self.analysis.mdf.columns:
-                if use_scaling and entry in self.scaling_factors:
-                    scaled_data = self.analysis.mdf[entry] / self.scaling_factors[entry]
-                    label = f"{entry} / {self.scaling_factors[entry]:.1e}"
-                    index = self.analysis.mdf.index
-                    self.ax.plot((index - index[0]).total_seconds()/60, scaled_data, label=label)
-                else:
-                    index = self.analysis.mdf.index
-                    self.ax.plot((index - index[0]).total_seconds()/60, self.analysis.mdf[entry], label=entry)
-
-        # Set white background for axes and figure
-        self.ax.set_facecolor("white")
-        self.figure.set_facecolor("white")
+        for entry in list(self.lines):
+            if entry not in self.analysis.mdf.columns:
+                self.lines.pop(entry)[0].remove()
+            elif entry not in all_selected:
+                self.lines[entry][0].set_visible(False)
 
-        # Add axis labels and title
-        self.ax.set_xlabel("Elapsed Time (min)")
-        self.ax.set_ylabel("Concentration")
-
-        # Embedded title and label
-        self.ax.legend()
-        self.ax.grid(True, color="gray", linestyle="--")
-
-        self.figure.tight_layout(pad=1)
-
-        # Set x and y limits if they exist in the state
-        self.canvas.draw()
-
-        # A different param has been selected; rescale y only
-        if 'temp_xlim' in locals():
-            self.ax.set_xlim(temp_xlim)
-            self.ax.autoscale(axis='y')
+        for entry in all_selected:
+            pyramid = self.pyramid(entry)
+            if use_scaling and entry in self.scaling_factors:
+                factor = self.scaling_factors[entry]
+                label = f"{entry} / {self.scaling_factors[entry]:.1e}"
+            else:
+                factor = 1
+                label = entry
+            # The whole run's envelope keeps its extremes for autoscaling
+            x, y = pyramid.decimate(pixels=pixels)
+            if entry in self.lines:
+                line = self.lines[entry][0]
+                line.set_data(x, y / factor)
+                line.set_label(label)
+                line.set_visible(True)
+            else:
+                line, = self.ax.plot(x, y / factor, label=label)
+            self.lines[entry] = [line, pyramid, factor]
+
+        handles = [self.lines[entry][0] for entry in all_selected]
+        if handles:
+            self.ax.legend(handles=handles)
+        elif self.ax.get_legend() is not None:
+            self.ax.get_legend().remove()
+        self.ax.relim(visible_only=True)
 
         # Only runs once after state is pulled
         if self.xlim is not None:
@@ -190,7 +232,17 @@ class DataViewer(QMainWindow):
             self.ax.set_ylim(self.ylim)
             self.xlim = None
             self.ylim = None
-        self.canvas.draw()
+        # A different param has been selected; rescale y only
+        elif had_lines:
+            self.ax.set_xlim(self.ax.get_xlim())
+            self.ax.autoscale(axis='y')
+        else:
+            self.ax.autoscale()
+
+        # New limits can change the tick labels, and so the margins they need
+        if (self.ax.get_xlim(), self.ax.get_ylim()) != limits:
+            self.figure.tight_layout(pad=1)
+        self.canvas.draw_idle()
 
     def on_home_clicked(self):
         self.ax.autoscale()
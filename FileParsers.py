@@ -1,39 +1,41 @@
 import os
+import io
+import csv
+import json
+import hashlib
+from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
 import pandas as pd
-from numpy import nan, unique, insert
+from numpy import nan, unique, interp, minimum, iinfo
+from pandas.tseries.api import guess_datetime_format
+from CycleIndex import CycleIndex
+
+# pyarrow is optional; when installed it backs the QMS reader and timestamp parsing
+HAS_PYARROW = find_spec('pyarrow') is not None
+DEFAULT_QMS_ENGINE = 'pyarrow' if HAS_PYARROW else 'c'
 
 class MassSpecParser:
-    def __init__(self, analysis):
+    def __init__(self, analysis, engine=None):
         self.filepath = analysis.filepath
         self.filename = analysis.filename
         self.header_row_number = None
         self.start_datetime = None
+        self.engine = engine or DEFAULT_QMS_ENGINE
 
     def parse(self):
-        with open(self.filepath, 'r') as f:
-            for i, line in enumerate(f):
-                if i == 0:
-                    if line.split(',')[1] != 'scans':
-                        raise ValueError("Invalid - Try Another CSV")
-                if i == 1:  # Row 2 contains the header row location
-                    self.header_row_number = int(line.split(',')[1]) + 1
-                if i == 2:  # Row 3 contains date and time info
-                    second_row = line.split(',')
-                    self.start_datetime = pd.to_datetime(
-                        second_row[1] + ' ' + second_row[3])
-                    break
-
-        # Read the CSV with the specified header
-        mdf = pd.read_csv(
-            self.filepath, header=self.header_row_number, encoding='unicode_escape')
-
-        # Use ms column to calculate datetime. Set as dataframe index
-        mdf['Datetime'] = self.start_datetime + \
-            pd.to_timedelta(mdf['ms'], unit='ms')
-        mdf = mdf.set_index('Datetime')
-
-        # Tweak columns and generate a list of compounds
-        mdf = mdf.drop(['Time', 'ms'], axis=1)
+        # Single pass: sniff the preamble, then hand the same handle to the reader
+        with open(self.filepath, 'rb') as f:
+            names = self.read_preamble(f)
+            mdf = self.read_body(f, names)
+        # A scan still being written (run in progress) is missing values the
+        # scan before it has
+        if len(mdf) > 1 and (pd.isna(mdf.index[-1]) or (
+                mdf.iloc[-1].isna() & mdf.iloc[-2].notna()).any()):
+            mdf = mdf.iloc[:-1]
+
+        # Generate a list of compounds
         compound_list = list(mdf.columns)
 
         start_time = mdf.index[0]
@@ -45,110 +47,691 @@ class MassSpecParser:
 
         return mdf, compound_list, cycle_times_df
 
+    def read_preamble(self, f):
+        """Read the scans/header/date lines and stop the handle after the header row"""
+        line = f.readline().decode('latin-1')
+        if len(line.split(',')) < 2 or line.split(',')[1] != 'scans':
+            raise ValueError("Invalid - Try Another CSV")
+        # Row 2 contains the header row location
+        self.header_row_number = int(f.readline().decode('latin-1').split(',')[1]) + 1
+        # Row 3 contains date and time info
+        second_row = f.readline().decode('latin-1').split(',')
+        self.start_datetime = pd.to_datetime(second_row[1] + ' ' + second_row[3])
+
+        # Skip to the header row, counting non-blank lines like read_csv does
+        rows_seen = 3
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError("Invalid - Try Another CSV")
+            if not line.strip():
+                continue
+            if rows_seen == self.header_row_number:
+                break
+            rows_seen += 1
+        header = next(csv.reader([line.decode('unicode_escape').strip('\r\n')]))
+        names = [name if name else f'Unnamed: {i}' for i, name in enumerate(header)]
+        if 'ms' not in names:
+            raise ValueError("Invalid - Try Another CSV")
+        return names
+
+    def read_body(self, f, names):
+        """Read scan rows from f as floats indexed by Datetime, skipping Time"""
+        columns = [name for name in names if name != 'Time']
+        data_offset = f.tell()
+        try:
+            if self.engine == 'pyarrow':
+                from pyarrow import csv as pa_csv, float64
+                table = pa_csv.read_csv(
+                    f,
+                    read_options=pa_csv.ReadOptions(column_names=names,
+                                                    encoding='latin-1'),
+                    convert_options=pa_csv.ConvertOptions(
+                        include_columns=columns,
+                        column_types={name: float64() for name in columns}))
+                mdf = table.to_pandas()
+            else:
+                mdf = pd.read_csv(f, header=None, names=names, usecols=columns,
+                                  dtype='float64')
+        except ValueError:
+            # Non-numeric junk in a compound column, fall back to coercion
+            f.seek(data_offset)
+            mdf = pd.read_csv(f, header=None, names=names, usecols=columns,
+                              encoding='latin-1')
+            mdf = mdf.apply(pd.to_numeric, errors='coerce')
+
+        # Use ms column to calculate datetime. Set as dataframe index
+        ms = mdf.pop('ms').to_numpy()
+        mdf.index = pd.DatetimeIndex(
+            self.start_datetime + pd.to_timedelta(ms, unit='ms'), name='Datetime')
+        return mdf
+
+
+# Columns of a Baldy2 temperature CSV, which has no header row
+BALDY2_COLUMNS = ['Date', 'Time', 'T1', 'T2', 'T3', 'T4']
+BALDY2_TEMP_COLUMNS = ['T1', 'T2', 'T3', 'T4']
+# Baldy2 temperatures are matched to QMS scans within this
+BALDY2_TOLERANCE = pd.Timedelta(seconds=10)
 
 class Baldy2Parser:
-    def __init__(self, mdf, file_path):
+    def __init__(self, mdf, file_path, join='nearest', datetime_format=None):
         self.mdf = mdf
         self.file_path = file_path
+        # 'nearest' takes the closest reading, 'interpolate' the linear
+        # interpolation between the readings around each scan
+        self.join = join
+        # Detected from the first row of the file when not given
+        self.datetime_format = datetime_format
 
     def parse(self):
-        # Read the temp CSV (no header)
-        temp_df = pd.read_csv(self.file_path, header=None)
-        # Assume columns: Date, Time, T1, T2, T3, T4, T5
-        temp_df.columns = ['Date', 'Time', 'T1', 'T2', 'T3', 'T4']
-
-        # Replace "OL" with nan in all temperature columns, make float
-        temp_columns = ['T1', 'T2', 'T3', 'T4']
-        temp_df[temp_columns] = temp_df[temp_columns].replace("OL", nan)
-        temp_df[temp_columns] = temp_df[temp_columns].astype(float)
-
-        # Combine date and time, parse to datetime
-        temp_df['Datetime'] = pd.to_datetime(temp_df['Date'] + ' ' + temp_df['Time'])
-        temp_df = temp_df.set_index('Datetime')
+        # Read the temp CSV (no header), "OL" (open loop) readings become NaN
+        temp_df = pd.read_csv(self.file_path, header=None, na_values=['OL'],
+                              dtype={0: 'object', 1: 'object', 2: 'float64',
+                                     3: 'float64', 4: 'float64', 5: 'float64'})
+        temp_df.columns = BALDY2_COLUMNS
+
+        # Combine date and time, parse with one format for the whole file
+        timestamps = temp_df['Date'].str.cat(temp_df['Time'], sep=' ')
+        if self.datetime_format is None:
+            self.datetime_format = guess_datetime_format(timestamps.iloc[0])
+        if self.datetime_format is None:
+            raise ValueError('Unrecognized Baldy2 date format')
+        temp_df['Datetime'] = parse_timestamps(timestamps, self.datetime_format)
+        temp_df = temp_df.dropna(subset=['Datetime']).set_index('Datetime')
 
         # Drop original date/time columns
         temp_df = temp_df.drop(['Date', 'Time'], axis=1)
         # Drop temperature columns that are all NaN
         temp_df = temp_df.dropna(axis=1, how='all')
         # Update temp_columns to reflect dropped columns
-        temp_columns = [col for col in temp_columns if col in temp_df.columns]
-
-        # Merge with mdf on nearest timestamp (tolerance 10s)
-        df = pd.merge_asof(
-            self.mdf.sort_index(), 
-            temp_df.sort_index(), 
-            left_index=True, 
-            right_index=True, 
-            direction='nearest', 
-            tolerance=pd.Timedelta(seconds=10)
-        )
+        temp_columns = [col for col in BALDY2_TEMP_COLUMNS if col in temp_df.columns]
+
+        # Both are normally written in time order already
+        mdf = self.mdf if self.mdf.index.is_monotonic_increasing \
+            else self.mdf.sort_index()
+        if not temp_df.index.is_monotonic_increasing:
+            temp_df = temp_df.sort_index()
+
+        if self.join == 'interpolate':
+            df = mdf.join(interpolate_onto(temp_df, mdf.index, BALDY2_TOLERANCE))
+        else:
+            # Merge with mdf on nearest timestamp (tolerance 10s)
+            df = pd.merge_asof(mdf, temp_df, left_index=True, right_index=True,
+                               direction='nearest', tolerance=BALDY2_TOLERANCE)
 
         return df, temp_columns
 
+def interpolate_onto(source, index, tolerance):
+    """Linearly interpolate source's columns at index
+
+    A NaN reading blanks the interval on either side of it, and times with no
+    reading within tolerance are left NaN.
+    """
+    times = index.asi8
+    source_times = source.index.asi8
+    result = pd.DataFrame(index=index)
+    if not len(source_times):
+        for col in source.columns:
+            result[col] = nan
+        return result
+    for col in source.columns:
+        # Past either end the edge reading is held, the tolerance check below
+        # then limits that to the same reach as a nearest match
+        result[col] = interp(times, source_times, source[col].to_numpy(dtype=float))
+    # Distance to the nearest reading, like merge_asof's tolerance
+    after = source_times.searchsorted(times).clip(0, len(source_times) - 1)
+    before = (after - 1).clip(0)
+    gap = minimum(abs(source_times[after] - times), abs(times - source_times[before]))
+    result.loc[gap > tolerance.value] = nan
+    return result
+
+BACKEND_TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+# Backend rows (~5 seconds) are matched to the nearest QMS scan within this
+MERGE_TOLERANCE = pd.Timedelta(seconds=10)
+# Live QMS rows still waiting on backend data are merged anyway past this lag
+LIVE_BACKEND_WAIT = pd.Timedelta(minutes=2)
+
+# Backend files share one schema: counters are integers, everything else float
+BACKEND_DTYPES = {'Timestamp': 'object',
+                  'No Completed Cycles': 'int64', 'Cycle Identifier': 'int64'}
+
+def is_backend_column(name):
+    """usecols filter that skips the MFCx.ID columns"""
+    return not (name.startswith('MFC') and name.endswith('.ID'))
+
+def read_backend_csv(source, **kwargs):
+    """Read backend rows with the pinned schema and index them by Datetime"""
+    if hasattr(source, 'seek'):
+        data_offset = source.tell()
+    try:
+        bdf = pd.read_csv(source, usecols=is_backend_column,
+                          dtype=defaultdict(lambda: 'float64', BACKEND_DTYPES),
+                          **kwargs)
+    except ValueError:
+        # A column that doesn't fit the schema, let pandas infer this file
+        if hasattr(source, 'seek'):
+            source.seek(data_offset)
+        bdf = pd.read_csv(source, usecols=is_backend_column, **kwargs)
+    return clean_backend_frame(bdf)
+
+def parse_timestamps(timestamps, format=BACKEND_TIMESTAMP_FORMAT):
+    """Parse timestamp strings of a known format, unparsable ones become NaT"""
+    if HAS_PYARROW:
+        # Much faster than pandas for the %p format
+        from pyarrow import array, compute, string
+        try:
+            return compute.strptime(
+                array(timestamps, type=string(), from_pandas=True),
+                format=format, unit='ns',
+                error_is_null=True).to_numpy(zero_copy_only=False)
+        except ValueError:
+            pass
+    return pd.to_datetime(
+        timestamps, format=format, errors='coerce')
+
+def clean_backend_frame(bdf):
+    """Index raw backend rows by Datetime and tidy the MFC columns"""
+    bdf['Datetime'] = parse_timestamps(bdf['Timestamp'])
+    # Drops a row still being written when the day's file is in progress
+    bdf = bdf.dropna(subset=['Datetime']).set_index('Datetime')
+
+    bdf = bdf.drop(['Timestamp'], axis=1)
+
+    # MFC's are a little buggy. MFC2 currently going NaN during sorption swap
+    bdf['MFC1.Massflow'] = bdf['MFC1.Massflow'].fillna(0)
+    bdf['MFC2.Massflow'] = bdf['MFC2.Massflow'].fillna(0)
+    bdf['MFC3.Massflow'] = bdf['MFC3.Massflow'].fillna(0)
+    bdf['MFC4.Massflow'] = bdf['MFC4.Massflow'].fillna(0)
+    return bdf
+
+# Bump when the layout of a backend catalog entry changes
+CATALOG_VERSION = 1
+# Bytes of a daily backend file between two recorded timestamp checkpoints
+CATALOG_CHECKPOINT_BYTES = 64 * 1024
+
+def read_line_timestamp(line, ts_column):
+    """Timestamp of one raw backend line, None if it is incomplete or unparsable"""
+    if not line.endswith(b'\n'):
+        return None
+    try:
+        return datetime.strptime(line.decode('latin-1').split(',')[ts_column],
+                                 BACKEND_TIMESTAMP_FORMAT)
+    except (ValueError, IndexError):
+        return None
+
+def scan_backend_file(path):
+    """Seek through a daily file recording its time span and checkpoints"""
+    with open(path, 'rb') as f:
+        header = f.readline()
+        data_offset = f.tell()
+        names = next(csv.reader([header.decode('latin-1').strip('\r\n')]))
+        ts_column = names.index('Timestamp')
+        size = f.seek(0, os.SEEK_END)
+
+        # (offset of a line start, its timestamp) every CATALOG_CHECKPOINT_BYTES
+        checkpoints = []
+        for pos in range(data_offset, size, CATALOG_CHECKPOINT_BYTES):
+            f.seek(pos)
+            if pos > data_offset:
+                f.readline()
+            offset = f.tell()
+            timestamp = read_line_timestamp(f.readline(), ts_column)
+            if timestamp is not None and \
+                    (not checkpoints or offset > checkpoints[-1][0]):
+                checkpoints.append((offset, timestamp))
+
+        # Newest complete row, searched backwards from the end of the file
+        tail_offset = max(data_offset, size - CATALOG_CHECKPOINT_BYTES)
+        f.seek(tail_offset)
+        lines = f.read().splitlines(keepends=True)
+        if tail_offset > data_offset:
+            lines = lines[1:]
+        last = None
+        for line in reversed(lines):
+            last = read_line_timestamp(line, ts_column)
+            if last is not None:
+                break
+
+    times = [timestamp for _, timestamp in checkpoints] + \
+        ([last] if last is not None else [])
+    return {
+        'data_offset': data_offset,
+        'first': times[0].isoformat() if times else None,
+        'last': times[-1].isoformat() if times else None,
+        # Windowed reads rely on time order, otherwise the whole file is read
+        'sorted': all(a <= b for a, b in zip(times, times[1:])),
+        'checkpoints': [(offset, timestamp.isoformat())
+                        for offset, timestamp in checkpoints],
+    }
+
+def prefetch(executor, function, items):
+    """Map function over items, computing the next result while one is used"""
+    futures = (executor.submit(function, item) for item in items)
+    pending = next(futures, None)
+    while pending is not None:
+        upcoming = next(futures, None)
+        yield pending.result()
+        pending = upcoming
+
+def read_backend_range(path, data_offset, begin, end):
+    """Read the backend rows stored between two line-aligned byte offsets"""
+    with open(path, 'rb') as f:
+        header = f.read(data_offset)
+        f.seek(begin)
+        chunk = f.read(end - begin)
+    return read_backend_csv(io.BytesIO(header + chunk))
+
+# Backend bytes parsed at a time when streaming the merge
+BACKEND_CHUNK_BYTES = 8 * 1024**2
+
+def backend_blocks(ranges, chunk_bytes=BACKEND_CHUNK_BYTES):
+    """Yield header + line-aligned blocks of at most ~chunk_bytes of the ranges"""
+    for path, data_offset, begin, end in ranges:
+        with open(path, 'rb') as f:
+            header = f.read(data_offset)
+            f.seek(begin)
+            remainder = b''
+            while begin < end:
+                block = f.read(min(chunk_bytes, end - begin))
+                begin += len(block)
+                if not block:
+                    break
+                block = remainder + block
+                # The range itself ends on a line boundary (or the end of file)
+                cut = len(block) if begin >= end else block.rfind(b'\n') + 1
+                remainder = block[cut:]
+                if cut:
+                    yield header + block[:cut]
+
+def merge_nearest_streaming(mdf, backend_chunks, tolerance=MERGE_TOLERANCE):
+    """merge_asof(direction='nearest') of time-ordered backend chunks onto mdf
+
+    Only the current chunk and the backend rows still within tolerance of an
+    unmerged scan are held, so memory doesn't grow with the backend folder.
+    Returns the merged frame and the backend columns, or None once a chunk
+    turns out not to be in time order (the catalog only checks checkpoints).
+    """
+    mdf = mdf.sort_index()
+    times = mdf.index
+    merged = []
+    window = None
+    newest = None
+    done = 0
+    for chunk in backend_chunks:
+        if not chunk.empty:
+            if not chunk.index.is_monotonic_increasing \
+                    or (newest is not None and chunk.index[0] < newest):
+                return None
+            newest = chunk.index[-1]
+        window = chunk if window is None else pd.concat([window, chunk])
+        if window.empty:
+            continue
+        # Scans this far before the newest backend row can't match a later one
+        ready = times.searchsorted(window.index[-1] - tolerance, side='left')
+        if ready > done:
+            merged.append(pd.merge_asof(
+                mdf.iloc[done:ready], window, left_index=True, right_index=True,
+                direction='nearest', tolerance=tolerance))
+            done = ready
+        if done == len(times):
+            break
+        # Keep the rows that may still be nearest to the remaining scans
+        window = window[window.index >= times[done] - tolerance]
+    if window is None:
+        raise ValueError('Matching CSV Not Found')
+    if done < len(times):
+        merged.append(pd.merge_asof(
+            mdf.iloc[done:], window, left_index=True, right_index=True,
+            direction='nearest', tolerance=tolerance))
+    return pd.concat(merged), list(window.columns)
+
+class BackendCatalog:
+    """Time span and timestamp checkpoints of each daily file in a backend folder
+
+    Entries are rescanned when a file's size or mtime changes, and are kept in
+    catalog_dir between sessions when one is given.
+    """
+    def __init__(self, folder_path, catalog_dir=None):
+        self.folder_path = folder_path
+        self.files = {}
+        self.changed = False
+        self.catalog_path = None
+        if catalog_dir is None:
+            return
+        folder_hash = hashlib.blake2b(os.path.abspath(folder_path).encode(),
+                                      digest_size=8).hexdigest()
+        self.catalog_path = os.path.join(catalog_dir, f'{folder_hash}.json')
+        try:
+            with open(self.catalog_path) as f:
+                catalog = json.load(f)
+            if catalog.get('version') == CATALOG_VERSION:
+                self.files = catalog['files']
+        except (OSError, ValueError):
+            pass
+
+    def entry(self, path):
+        """Catalog entry for one daily file, scanning it if new or modified"""
+        stat = os.stat(path)
+        name = os.path.basename(path)
+        entry = self.files.get(name)
+        if entry is None or entry['size'] != stat.st_size \
+                or entry['mtime_ns'] != stat.st_mtime_ns:
+            entry = scan_backend_file(path)
+            entry['size'] = stat.st_size
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self.files[name] = entry
+            self.changed = True
+        return entry
+
+    def byte_range(self, path, start, end):
+        """Line-aligned (begin, end) offsets holding every row from start to end"""
+        entry = self.entry(path)
+        if entry['first'] is None or pd.Timestamp(entry['last']) < start \
+                or pd.Timestamp(entry['first']) > end:
+            return None
+        begin, stop = entry['data_offset'], entry['size']
+        if not entry['sorted']:
+            return begin, stop
+        for offset, timestamp in entry['checkpoints']:
+            timestamp = pd.Timestamp(timestamp)
+            # Rows before a checkpoint are no later than it, rows after no earlier
+            if timestamp < start:
+                begin = offset
+            elif timestamp > end:
+                stop = offset
+                break
+        return begin, stop
+
+    def save(self):
+        if self.catalog_path is None or not self.changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+            with open(self.catalog_path + '.tmp', 'w') as f:
+                json.dump({'version': CATALOG_VERSION, 'files': self.files}, f)
+            os.replace(self.catalog_path + '.tmp', self.catalog_path)
+            self.changed = False
+        except OSError as e:
+            # The catalog only saves rescans, the data can always be reread
+            print(f'Could not save backend catalog: {e}')
+
 class BackendParser:
-    def __init__(self, mdf, start_datetime, duration, filename, folder_path):
+    def __init__(self, mdf, start_datetime, duration, filename, folder_path,
+                 catalog_dir=None):
         self.folder_path = folder_path
         self.filename = filename
         self.mdf = mdf
         self.start_datetime = start_datetime
         self.duration = duration
-
-    def parse(self):
-        # Select backend files corresponding to the dates in the selected mass spec file
+        self.catalog = BackendCatalog(folder_path, catalog_dir)
+        # Backend rows that can be matched to a scan of the mass spec run
+        self.window_start = self.mdf.index.min() - MERGE_TOLERANCE
+        self.window_end = self.mdf.index.max() + MERGE_TOLERANCE
+
+    def backend_ranges(self):
+        """(path, data offset, begin, end) of the backend rows in the run window"""
+        # Every date of the mass spec file needs its backend file, the day
+        # before is only read when its rows reach into the window
         dates_to_pull = unique(self.mdf.index.date)
-        dates_to_pull = insert(dates_to_pull,0,
-                                    dates_to_pull.min() - pd.Timedelta(days=1))
-        backend_filenames = \
-        [f"data_{date.strftime('%Y-%m-%d')}.csv" for date in dates_to_pull]
-
-        # Concatenate all requisite files and clean columns
-        try:
-            backend_dataframes = \
-                [pd.read_csv(os.path.join(self.folder_path,f)) for f in backend_filenames]
-        except FileNotFoundError as e:
+        backend_paths = [backend_file(self.folder_path, date) for date in dates_to_pull]
+        if not all(os.path.isfile(path) for path in backend_paths):
             raise ValueError('Matching CSV Not Found')
-        bdf = pd.concat(backend_dataframes)
-        bdf['Datetime'] = \
-            pd.to_datetime(bdf['Timestamp'], format="%m/%d/%Y %I:%M:%S %p")
-        bdf = bdf.set_index('Datetime')
-
-        bdf = bdf.drop(['Timestamp','MFC1.ID','MFC2.ID','MFC3.ID','MFC4.ID','MFC5.ID']
-                        , axis=1)
-
-        # MFC's are a little buggy. MFC2 currently going NaN during sorption swap
-        bdf['MFC1.Massflow'] = bdf['MFC1.Massflow'].fillna(0)
-        bdf['MFC2.Massflow'] = bdf['MFC2.Massflow'].fillna(0)
-        bdf['MFC3.Massflow'] = bdf['MFC3.Massflow'].fillna(0)
-        bdf['MFC4.Massflow'] = bdf['MFC4.Massflow'].fillna(0)
-
-        # Generate a list of parameters
-        reactor_parameters = list(bdf.columns)
+        day_before = backend_file(self.folder_path,
+                                  dates_to_pull.min() - pd.Timedelta(days=1))
+        if os.path.isfile(day_before):
+            backend_paths.insert(0, day_before)
+
+        ranges = []
+        for path in backend_paths:
+            byte_range = self.catalog.byte_range(path, self.window_start,
+                                                 self.window_end)
+            if byte_range is not None:
+                ranges.append((path, self.catalog.entry(path)['data_offset'])
+                              + byte_range)
+        self.catalog.save()
+        if not ranges:
+            raise ValueError('Matching CSV Not Found')
+        return ranges
+
+    def backend_files(self):
+        """Paths of the daily backend files covering the mass spec run"""
+        return [path for path, _, _, _ in self.backend_ranges()]
+
+    def in_time_order(self, ranges):
+        """Whether the ranges' rows, read in order, are sorted by time"""
+        last = None
+        for path, _, _, _ in ranges:
+            entry = self.catalog.entry(path)
+            if not entry['sorted'] or (last is not None and entry['first'] is not None
+                                       and pd.Timestamp(entry['first']) < last):
+                return False
+            if entry['last'] is not None:
+                last = pd.Timestamp(entry['last'])
+        return True
+
+    def merge_sorted(self, ranges):
+        """Read all the ranges and sort them by time before merging"""
+        with ThreadPoolExecutor() as executor:
+            bdf = pd.concat(executor.map(
+                lambda byte_range: read_backend_range(*byte_range), ranges))
+        df = pd.merge_asof(self.mdf.sort_index(), bdf.sort_index(),
+                           left_index=True, right_index=True,
+                           direction='nearest', tolerance=MERGE_TOLERANCE)
+        return df, list(bdf.columns)
 
+    def parse(self):
         # Merges backend data (~5 seconds) to mass-spec points (~30 seconds)
         # Correlation tolerance is 10 seconds
-        df = pd.merge_asof(self.mdf.sort_index(), bdf.sort_index(), on='Datetime',
-                            direction='nearest', tolerance=pd.Timedelta(seconds=10))
-        df = df.set_index('Datetime')
-
-        # Create a df that deals with cycle-specific values
-        # Get unique cycle numbers
-        cycle_numbers = df['No Completed Cycles'].dropna().unique()
-
-        cycle_times = []
-        for cycle_number in cycle_numbers:
-            # Filter the DataFrame for the current cycle number
-            cycle_data = df[df['No Completed Cycles'] == cycle_number]
-
-            # Get the start and end times for the current cycle
-            start_time = cycle_data.index.min()
-            end_time = cycle_data.index.max()
-            cycle_times.append({'Cycle': cycle_number,
-                                'Start': start_time, 'End': end_time})
+        try:
+            ranges = self.backend_ranges()
+            merged = None
+            if self.in_time_order(ranges):
+                # Stream the backend in blocks, parsing the next one meanwhile
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    merged = merge_nearest_streaming(
+                        self.mdf, prefetch(executor, read_backend_csv,
+                                           (io.BytesIO(block) for block
+                                            in backend_blocks(ranges))))
+            if merged is None:
+                # Out of order files have to be sorted as a whole first
+                merged = self.merge_sorted(ranges)
+            df, reactor_parameters = merged
+        except FileNotFoundError as e:
+            raise ValueError('Matching CSV Not Found')
 
-        # Convert the list of dictionaries to a DataFrame
-        cycle_times_df = pd.DataFrame(cycle_times)
+        # Create a df that deals with cycle-specific values, using the row
+        # ranges of each cycle rather than filtering the whole frame per cycle
+        self.cycle_index = CycleIndex(df)
+        cycle_times_df = self.cycle_index.cycle_times(df.index)
         return df, reactor_parameters, cycle_times_df
+
+def backend_file(folder_path, date):
+    return os.path.join(folder_path, f"data_{date.strftime('%Y-%m-%d')}.csv")
+
+def find_offset(path, data_offset, is_after):
+    """Binary search a time-sorted CSV for the first line where is_after(fields)"""
+    with open(path, 'rb') as f:
+        def line_start(pos):
+            if pos <= data_offset:
+                return data_offset
+            f.seek(pos - 1)
+            f.readline()
+            return f.tell()
+
+        def after(pos):
+            f.seek(line_start(pos))
+            line = f.readline()
+            # A half-written last line is where reading has to resume
+            if not line.endswith(b'\n'):
+                return True
+            try:
+                return is_after(line.decode('latin-1').split(','))
+            except (ValueError, IndexError):
+                return False
+
+        f.seek(0, os.SEEK_END)
+        low, high = data_offset, f.tell()
+        while low < high:
+            mid = (low + high) // 2
+            if after(mid):
+                high = mid
+            else:
+                low = mid + 1
+        return line_start(low)
+
+def read_appended(path, offset):
+    """Return the complete lines written after offset and the offset past them"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    end = chunk.rfind(b'\n') + 1
+    return chunk[:end], offset + end
+
+class LiveFollower:
+    """Tail an in-progress QMS export and the current day's backend file"""
+    def __init__(self, parser, last_time, folder_path=None):
+        self.parser = parser
+        self.folder_path = folder_path
+        # QMS rows waiting for backend data, and recent backend rows to match them
+        self.pending = None
+        self.backend_rows = None
+
+        # Resume after the newest row already loaded
+        with open(parser.filepath, 'rb') as f:
+            self.qms_names = parser.read_preamble(f)
+            data_offset = f.tell()
+        ms_column = self.qms_names.index('ms')
+        last_ms = (last_time - parser.start_datetime) / pd.Timedelta(milliseconds=1)
+        self.qms_offset = find_offset(parser.filepath, data_offset,
+                                      lambda fields: float(fields[ms_column]) > last_ms)
+
+        if folder_path is not None:
+            # Keep backend rows that may still be nearest to upcoming scans
+            self.open_backend(last_time.date(), last_time - MERGE_TOLERANCE)
+
+    def open_backend(self, date, since=None):
+        self.backend_date = date
+        self.backend_path = backend_file(self.folder_path, date)
+        if not os.path.isfile(self.backend_path):
+            self.backend_offset = None
+            return
+        with open(self.backend_path, 'rb') as f:
+            header = f.readline()
+            data_offset = f.tell()
+        self.backend_names = next(csv.reader([header.decode('latin-1').strip('\r\n')]))
+        self.backend_offset = data_offset
+        if since is not None:
+            ts_column = self.backend_names.index('Timestamp')
+            self.backend_offset = find_offset(
+                self.backend_path, data_offset, lambda fields: pd.to_datetime(
+                    fields[ts_column], format=BACKEND_TIMESTAMP_FORMAT) >= since)
+
+    def read_backend(self):
+        while True:
+            if self.backend_offset is None:
+                # Today's file hasn't been created yet
+                self.open_backend(self.backend_date)
+            if self.backend_offset is not None:
+                chunk, self.backend_offset = \
+                    read_appended(self.backend_path, self.backend_offset)
+                if chunk:
+                    rows = read_backend_csv(io.BytesIO(chunk), header=None,
+                                            names=self.backend_names)
+                    self.backend_rows = rows if self.backend_rows is None \
+                        else pd.concat([self.backend_rows, rows])
+            # The backend starts a new file each day
+            next_date = self.backend_date + pd.Timedelta(days=1)
+            if not os.path.isfile(backend_file(self.folder_path, next_date)):
+                break
+            self.open_backend(next_date)
+
+    def poll(self):
+        """Return newly appended QMS rows merged with backend data, or None"""
+        chunk, self.qms_offset = read_appended(self.parser.filepath, self.qms_offset)
+        if chunk:
+            rows = self.parser.read_body(io.BytesIO(chunk), self.qms_names)
+            self.pending = rows if self.pending is None \
+                else pd.concat([self.pending, rows])
+        if self.pending is None or self.pending.empty:
+            return None
+        if self.folder_path is None:
+            rows, self.pending = self.pending, None
+            return rows
+
+        # A scan is final once backend rows past its tolerance window exist
+        self.read_backend()
+        cutoff = self.pending.index[-1] - LIVE_BACKEND_WAIT
+        if self.backend_rows is not None and not self.backend_rows.empty:
+            cutoff = max(cutoff, self.backend_rows.index[-1] - MERGE_TOLERANCE)
+        rows = self.pending[self.pending.index <= cutoff]
+        self.pending = self.pending[self.pending.index > cutoff]
+        if rows.empty:
+            return None
+        if self.backend_rows is None or self.backend_rows.empty:
+            return rows
+        rows = pd.merge_asof(rows, self.backend_rows, left_index=True,
+                             right_index=True, direction='nearest',
+                             tolerance=MERGE_TOLERANCE)
+        self.backend_rows = self.backend_rows[
+            self.backend_rows.index >= rows.index[-1] - MERGE_TOLERANCE]
+        return rows
+
+    def extend_cycle_times(self, cycle_times_df, rows):
+        """Stretch or append the cycles covered by new rows, return those cycles"""
+        if 'No Completed Cycles' not in rows.columns:
+            cycle_times_df.loc[cycle_times_df.index[-1], 'End'] = rows.index[-1]
+            return cycle_times_df, [cycle_times_df['Cycle'].iloc[-1]]
+        spans = rows.index.to_series().groupby(
+            rows['No Completed Cycles'], sort=False).agg(['min', 'max'])
+        new_cycles = []
+        for cycle_number, (start_time, end_time) in spans.iterrows():
+            existing = cycle_times_df.index[cycle_times_df['Cycle'] == cycle_number]
+            if len(existing):
+                cycle_times_df.loc[existing[0], 'End'] = end_time
+            else:
+                new_cycles.append({'Cycle': cycle_number,
+                                   'Start': start_time, 'End': end_time})
+        if new_cycles:
+            cycle_times_df = pd.concat(
+                [cycle_times_df, pd.DataFrame(new_cycles)], ignore_index=True)
+        return cycle_times_df, list(spans.index)
     
+# Backend counters that compact mode stores as the smallest integer type
+COUNTER_COLUMNS = ['No Completed Cycles', 'Cycle Identifier']
+
+def smallest_int_dtype(values):
+    """Smallest integer dtype holding values, nullable when some are missing"""
+    for dtype in ('int8', 'int16', 'int32', 'int64'):
+        if iinfo(dtype).min <= values.min() and values.max() <= iinfo(dtype).max:
+            break
+    return dtype.capitalize() if values.isna().any() else dtype
+
+def compact_frame(df, columns, drop_empty=()):
+    """Shrink signal columns of df in place for compact memory mode
+
+    Float columns become float32 and the backend counters small integers.
+    Columns in drop_empty that hold no data at all are removed and returned.
+    """
+    dropped = [col for col in drop_empty
+               if col in df.columns and df[col].isna().all()]
+    df.drop(columns=dropped, inplace=True)
+    for col in columns:
+        if col not in df.columns:
+            continue
+        values = df[col]
+        if col in COUNTER_COLUMNS:
+            present = values.dropna()
+            if len(present) and (present % 1 == 0).all():
+                df[col] = values.astype(smallest_int_dtype(values))
+        elif pd.api.types.is_float_dtype(values) and values.dtype != 'float32':
+            df[col] = values.astype('float32')
+    return dropped
+
+def compact_savings(df, dropped=()):
+    """Bytes df (plus its dropped columns) saves versus all 8 byte columns"""
+    usage = df.memory_usage(index=False)
+    return int(8 * len(df) * (len(usage) + len(dropped)) - usage.sum())
+
 def save_pdf_report(analysis):
     """Export a PDF report with run parameters, cycle_times_df, and all current plot images."""
     from reportlab.lib.pagesizes import letter
@@ -0,0 +1,57 @@
+from numpy import arange, asarray, column_stack, concatenate, isnan, log2, maximum, \
+    minimum, nan, searchsorted, where
+
+def combine(values, positions, take_second):
+    """Halve a level: keep the value of each pair of buckets take_second picks"""
+    if len(values) % 2:
+        values = concatenate([values, [nan]])
+        positions = concatenate([positions, positions[-1:]])
+    first, second = values[0::2], values[1::2]
+    take = take_second(first, second)
+    return where(take, second, first), where(take, positions[1::2], positions[0::2])
+
+class MinMaxPyramid:
+    """Min/max envelopes of a column at every power of two rows per bucket
+
+    Level k keeps, for each bucket of 2**k rows, the row positions of its
+    lowest and highest value (NaNs only win an all-NaN bucket). Built once in
+    O(rows), after which any x-range is drawn from about one bucket per
+    pixel column, so peaks stay visible however far the view is zoomed out.
+    """
+    def __init__(self, x, y):
+        self.x = asarray(x, dtype=float)
+        self.y = asarray(y, dtype=float)
+        # Unsorted times can't be searched, draw them whole
+        self.sorted = bool((self.x[1:] >= self.x[:-1]).all())
+        self.levels = []
+        low_values = high_values = self.y
+        low_rows = high_rows = arange(len(self.y))
+        while self.sorted and len(low_rows) > 1:
+            low_values, low_rows = combine(low_values, low_rows,
+                lambda a, b: (b < a) | isnan(a))
+            high_values, high_rows = combine(high_values, high_rows,
+                lambda a, b: (b > a) | isnan(a))
+            self.levels.append((low_rows, high_rows))
+
+    def decimate(self, xmin=None, xmax=None, pixels=1000):
+        """x and y to draw for the view xmin to xmax, pixels wide
+
+        Keeps one row either side of the view so the line runs off its edges.
+        """
+        if not self.sorted or len(self.x) <= 2 * pixels:
+            return self.x, self.y
+        lo = 0 if xmin is None else max(searchsorted(self.x, xmin) - 1, 0)
+        hi = len(self.x) if xmax is None else \
+            min(searchsorted(self.x, xmax, 'right') + 1, len(self.x))
+        rows = hi - lo
+        if rows <= 2 * pixels:
+            return self.x[lo:hi], self.y[lo:hi]
+        level = min(int(log2(rows / pixels)), len(self.levels))
+        low_rows, high_rows = self.levels[level - 1]
+        first, stop = lo >> level, ((hi - 1) >> level) + 1
+        low, high = low_rows[first:stop], high_rows[first:stop]
+        # Each bucket's min and max in time order, between the view's end rows
+        # (end buckets may reach past them)
+        positions = concatenate([[lo], column_stack(
+            [minimum(low, high), maximum(low, high)]).ravel().clip(lo, hi - 1), [hi - 1]])
+        return self.x[positions], self.y[positions]
@@ -0,0 +1,80 @@
+"""Cycle metrics over a grid of Regression Start/End (%) and QMS Input Ratio (%)
+
+Grid points are handed to a process pool in rows of one QMS Input Ratio and
+Regression Start (%) each. Every worker process starts from a fork of the
+run's calculator, so the run's derived columns are reused as they are, and
+the secondary columns of a new QMS Input Ratio are calculated once per process
+then served from its SecondaryCache. Each grid point then only reruns the
+stages that read the regression thresholds.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import pandas as pd
+
+# Swept run parameters, by their run_parameters.csv name
+SWEEP_PARAMETERS = {
+    'QMS Input Ratio (%)': 'qms_input_ratio',
+    'Regression Start (%)': 'regression_start',
+    'Regression End (%)': 'regression_end',
+}
+# Per-cycle metrics kept for every grid point
+SWEEP_METRICS = ['Sorbent Capacity [gCO2/gSorbent]', 'Capacity % to KPI',
+                 'Rate Constant K (Dry)', 'Rate Constant K (Wet)',
+                 'Wet Kinetics Regression R2']
+
+# The run's calculator, given to each worker process once instead of per task
+source_calculator = None
+
+def init_worker(calculator):
+    global source_calculator
+    source_calculator = calculator
+
+def sweep_row(qms_input_ratio, regression_start, regression_ends):
+    """Tidy metric rows for one QMS Input Ratio and Regression Start (%)"""
+    calculator = source_calculator.fork()
+    frames = []
+    for regression_end in regression_ends:
+        params = calculator.params._replace(qms_input_ratio=qms_input_ratio,
+            regression_start=regression_start, regression_end=regression_end)
+        calculator.update(params, calculator.cuts)
+        metrics = calculator.cycle_times_df[['Cycle'] + SWEEP_METRICS].copy()
+        metrics.insert(0, 'QMS Input Ratio (%)', qms_input_ratio)
+        metrics.insert(1, 'Regression Start (%)', regression_start)
+        metrics.insert(2, 'Regression End (%)', regression_end)
+        frames.append(metrics)
+    # Later rows of this ratio in the same process reuse its secondary columns
+    source_calculator.secondary_cache = calculator.secondary_cache
+    return pd.concat(frames, ignore_index=True)
+
+def sweep(calculator, grid, workers=None):
+    """SWEEP_METRICS of every cycle at every point of grid, as a tidy table
+
+    grid maps each SWEEP_PARAMETERS name to the values to try. calculator
+    must already have calculated the run once, its cuts apply throughout.
+    A Regression End (%) at or below the Regression Start (%) is skipped.
+    """
+    if calculator.params is None:
+        raise ValueError('Run parameters must be valid before sweeping')
+    qms_input_ratios, regression_starts, regression_ends = [
+        sorted(set(float(value) for value in grid[name])) for name in SWEEP_PARAMETERS]
+    tasks = [(ratio, start, [end for end in regression_ends if end > start])
+             for ratio, start in product(qms_input_ratios, regression_starts)]
+    tasks = [task for task in tasks if task[2]]
+    if not tasks:
+        raise ValueError('No Regression End (%) above a Regression Start (%)')
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(calculator,)) as executor:
+        frames = list(executor.map(sweep_row, *zip(*tasks)))
+    return pd.concat(frames, ignore_index=True)
+
+def sweep_grid(results, metric, qms_input_ratio, cycle=None):
+    """Regression Start x Regression End table of a metric, for the heatmap
+
+    Averaged over cycles unless a cycle is given.
+    """
+    rows = results[results['QMS Input Ratio (%)'] == qms_input_ratio]
+    if cycle is not None:
+        rows = rows[rows['Cycle'] == cycle]
+    return rows.pivot_table(index='Regression Start (%)', columns='Regression End (%)',
+                            values=metric, aggfunc='mean', dropna=False)
@@ -0,0 +1,106 @@
+import os
+import json
+import shutil
+import hashlib
+from importlib.util import find_spec
+import pandas as pd
+
+# Bump when the on-disk layout or parser output changes to orphan old entries
+CACHE_VERSION = 1
+# Total bytes kept on disk before least recently used runs are evicted
+CACHE_SIZE_LIMIT = 2 * 1024**3
+
+class RunCache:
+    """Parquet cache of parsed/merged runs, keyed by the source files' contents"""
+    def __init__(self, cache_dir, size_limit=CACHE_SIZE_LIMIT):
+        self.cache_dir = cache_dir
+        self.size_limit = size_limit
+        # Problem the last fetch had with the cache, for the caller's status
+        self.warning = None
+        # Parquet needs pyarrow; without it every lookup is a miss
+        self.enabled = find_spec('pyarrow') is not None
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, paths, variant=''):
+        """Hash name, size, mtime and contents of every source file"""
+        key_hash = hashlib.blake2b(f'v{CACHE_VERSION}'.encode(), digest_size=16)
+        if variant:
+            key_hash.update(f'|{variant}'.encode())
+        for path in paths:
+            stat = os.stat(path)
+            key_hash.update(f'{os.path.basename(path)}|{stat.st_size}|'
+                            f'{stat.st_mtime_ns}|'.encode())
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    key_hash.update(chunk)
+        return key_hash.hexdigest()
+
+    def fetch(self, paths, parse, variant=''):
+        """Return parse()'s (mdf, columns, cycle_times_df), from disk when possible
+
+        variant separates entries whose parse output differs for the same files,
+        e.g. a merge onto a compacted mass spec frame.
+        """
+        self.warning = None
+        if not self.enabled:
+            return parse()
+        key = self.key(paths, variant)
+        cached = self.load(key)
+        if cached is not None:
+            return cached
+        mdf, columns, cycle_times_df = parse()
+        self.store(key, mdf, columns, cycle_times_df)
+        return mdf, columns, cycle_times_df
+
+    def load(self, key):
+        entry = os.path.join(self.cache_dir, key)
+        meta_path = os.path.join(entry, 'meta.json')
+        if not os.path.isfile(meta_path):
+            return None
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            mdf = pd.read_parquet(os.path.join(entry, 'mdf.parquet'))
+            cycle_times_df = pd.read_parquet(os.path.join(entry, 'cycles.parquet'))
+        except Exception as e:
+            self.warning = f'Discarded unreadable cached run ({e})'
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        # Touch the entry so eviction sees it as recently used
+        os.utime(meta_path)
+        return mdf, meta['columns'], cycle_times_df
+
+    def store(self, key, mdf, columns, cycle_times_df):
+        entry = os.path.join(self.cache_dir, key)
+        try:
+            os.makedirs(entry, exist_ok=True)
+            mdf.to_parquet(os.path.join(entry, 'mdf.parquet'))
+            cycle_times_df.to_parquet(os.path.join(entry, 'cycles.parquet'))
+            # Written last, so a half-written entry never looks valid
+            with open(os.path.join(entry, 'meta.json'), 'w') as f:
+                json.dump({'columns': list(columns)}, f)
+        except Exception as e:
+            # Caching is best effort, a frame pyarrow can't store is just re-parsed
+            self.warning = f'Could not cache run ({e})'
+            shutil.rmtree(entry, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits its size limit"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(entry):
+                continue
+            meta_path = os.path.join(entry, 'meta.json')
+            last_used = os.path.getmtime(meta_path) if os.path.isfile(meta_path) else 0
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((last_used, size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.size_limit:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
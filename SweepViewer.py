@@ -0,0 +1,183 @@
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, \
+    QPushButton, QComboBox, QGroupBox, QFileDialog
+from PyQt5.QtCore import QThread, pyqtSignal
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas, \
+    NavigationToolbar2QT as NavigationToolbar
+from matplotlib.figure import Figure
+from numpy import linspace
+from ParameterSweep import SWEEP_PARAMETERS, SWEEP_METRICS, sweep, sweep_grid
+
+class SweepWorker(QThread):
+    """Runs a parameter sweep off the GUI thread"""
+    swept = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, calculator, grid):
+        super().__init__()
+        self.calculator = calculator
+        self.grid = grid
+
+    def run(self):
+        try:
+            self.swept.emit(sweep(self.calculator, self.grid))
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class SweepViewer(QWidget):
+    def __init__(self, analysis):
+        super().__init__()
+        self.analysis = analysis
+        self.results = None
+        self.worker = None
+
+        main_layout = QHBoxLayout(self)
+
+        # Grid inputs: From, To and Steps of each swept parameter
+        grid_layout = QVBoxLayout()
+        self.grid_inputs = {}
+        for name in SWEEP_PARAMETERS:
+            row = QHBoxLayout()
+            row.addWidget(QLabel(name))
+            inputs = [QLineEdit() for _ in range(3)]
+            for label, widget in zip(['From', 'To', 'Steps'], inputs):
+                widget.setPlaceholderText(label)
+                row.addWidget(widget)
+            self.grid_inputs[name] = inputs
+            grid_layout.addLayout(row)
+        self.sweep_button = QPushButton("Run Sweep")
+        self.save_button = QPushButton("Save Results CSV")
+        self.save_button.setEnabled(False)
+        self.sweep_status = QLabel("Status: No sweep run")
+        grid_layout.addWidget(self.sweep_button)
+        grid_layout.addWidget(self.save_button)
+        grid_layout.addWidget(self.sweep_status)
+
+        # Heatmap selection
+        self.metric_dropdown = QComboBox()
+        self.metric_dropdown.addItems(SWEEP_METRICS)
+        self.ratio_dropdown = QComboBox()
+        self.cycle_dropdown = QComboBox()
+        for label, dropdown in [("Metric", self.metric_dropdown),
+                                ("QMS Input Ratio (%)", self.ratio_dropdown),
+                                ("Cycle", self.cycle_dropdown)]:
+            row = QHBoxLayout()
+            row.addWidget(QLabel(label))
+            row.addWidget(dropdown)
+            grid_layout.addLayout(row)
+        grid_layout.addStretch()
+
+        grid_groupbox = QGroupBox("Parameter Sweep")
+        grid_groupbox.setLayout(grid_layout)
+
+        plot_panel = QVBoxLayout()
+        self.figure = Figure(figsize=(8, 6))
+        self.canvas = FigureCanvas(self.figure)
+        self.toolbar = NavigationToolbar(self.canvas, self)
+        plot_panel.addWidget(self.toolbar)
+        plot_panel.addWidget(self.canvas)
+
+        main_layout.addWidget(grid_groupbox, stretch=1)
+        main_layout.addLayout(plot_panel, stretch=3)
+
+        self.sweep_button.clicked.connect(self.run_sweep)
+        self.save_button.clicked.connect(self.save_results)
+        for dropdown in (self.metric_dropdown, self.ratio_dropdown, self.cycle_dropdown):
+            dropdown.currentIndexChanged.connect(self.update_plot)
+
+    def pull_state(self):
+        """Start empty grid inputs at the current run parameters"""
+        for name, inputs in self.grid_inputs.items():
+            if not any(widget.text() for widget in inputs):
+                value = self.analysis.state_text[name]
+                inputs[0].setText(value)
+                inputs[1].setText(value)
+                inputs[2].setText('1')
+
+    def grid(self):
+        """Values to try for each swept parameter, evenly spaced From to To"""
+        grid = {}
+        for name, (start, stop, steps) in self.grid_inputs.items():
+            try:
+                grid[name] = linspace(float(start.text()), float(stop.text()),
+                                      int(steps.text())).round(6).tolist()
+            except ValueError:
+                raise ValueError(f"'{name}' needs a number From, To and Steps")
+        return grid
+
+    def run_sweep(self):
+        calculator = self.analysis.cycle_instance.calculator
+        if self.worker is not None:
+            return
+        if calculator is None or calculator.params is None \
+                or self.analysis.cycle_instance.calculating():
+            self.sweep_status.setText("Status: Wait for the run to be calculated")
+            return
+        try:
+            grid = self.grid()
+        except ValueError as e:
+            self.sweep_status.setStyleSheet("color: red")
+            self.sweep_status.setText(f"Error: {e}")
+            return
+        self.sweep_status.setStyleSheet("")
+        self.sweep_status.setText("Sweeping... please wait")
+        self.sweep_button.setEnabled(False)
+        self.worker = SweepWorker(calculator, grid)
+        self.worker.swept.connect(self.show_results)
+        self.worker.failed.connect(self.show_error)
+        self.worker.finished.connect(self.sweep_finished)
+        self.worker.start()
+
+    def sweep_finished(self):
+        self.worker.wait()
+        self.worker = None
+        self.sweep_button.setEnabled(True)
+
+    def show_error(self, message):
+        self.sweep_status.setStyleSheet("color: red")
+        self.sweep_status.setText(f"Error: {message}")
+
+    def show_results(self, results):
+        self.results = results
+        points = results[list(SWEEP_PARAMETERS)].drop_duplicates()
+        self.sweep_status.setText(f"Status: Swept {len(points)} grid points")
+        self.save_button.setEnabled(True)
+        for dropdown, values in [
+                (self.ratio_dropdown, sorted(results['QMS Input Ratio (%)'].unique())),
+                (self.cycle_dropdown, ['Mean of Cycles'] + results['Cycle'].unique().tolist())]:
+            dropdown.blockSignals(True)
+            dropdown.clear()
+            dropdown.addItems([str(value) for value in values])
+            dropdown.blockSignals(False)
+        self.update_plot()
+
+    def save_results(self):
+        file_name, _ = QFileDialog.getSaveFileName(
+            self, "Save Sweep Results", "parameter_sweep.csv", "CSV Files (*.csv)")
+        if file_name:
+            self.results.to_csv(file_name, index=False)
+
+    def update_plot(self):
+        if self.results is None or not self.ratio_dropdown.count():
+            return
+        metric = self.metric_dropdown.currentText()
+        cycle = None if self.cycle_dropdown.currentIndex() == 0 \
+            else self.results['Cycle'].unique()[self.cycle_dropdown.currentIndex() - 1]
+        ratio = sorted(self.results['QMS Input Ratio (%)'].unique())[
+            self.ratio_dropdown.currentIndex()]
+        table = sweep_grid(self.results, metric, ratio, cycle)
+
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+        image = ax.imshow(table.to_numpy(dtype=float), origin='lower', aspect='auto',
+                          cmap='viridis')
+        ax.set_xticks(range(len(table.columns)))
+        ax.set_xticklabels([f'{value:g}' for value in table.columns], rotation=90)
+        ax.set_yticks(range(len(table.index)))
+        ax.set_yticklabels([f'{value:g}' for value in table.index])
+        ax.set_xlabel('Regression End (%)')
+        ax.set_ylabel('Regression Start (%)')
+        cycle_text = 'mean of cycles' if cycle is None else f'cycle {cycle}'
+        ax.set_title(f'{metric} ({cycle_text}, QMS Input Ratio {ratio:g}%)')
+        self.figure.colorbar(image, ax=ax, label=metric)
+        self.figure.tight_layout()
+        self.canvas.draw()